@@ -11,10 +11,14 @@ Starts:
 """
 
 import asyncio
+import multiprocessing
 import signal
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import httpx
+
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent))
 
@@ -29,33 +33,60 @@ from src.workers.scheduler import Scheduler
 # Graceful shutdown event
 shutdown_event = asyncio.Event()
 
+# Startup/shutdown banner rule (each banner is logged as one record)
+_BANNER = "=" * 60
+
+# Email -> order hand-off queue bound (back-pressure on IMAP polling)
+ORDER_QUEUE_MAXSIZE = 1000
+
+# One robot process per supplier queue (Mutlu + Mann run in parallel)
+ROBOT_PROCESS_WORKERS = 2
+
+# Shared outbound HTTP client (keep-alive connections reused across services)
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=30)
+HTTP_TIMEOUT = httpx.Timeout(10.0)
+
 # Global worker instances
 email_worker: EmailWorker = None
 order_worker: OrderWorker = None
 scheduler: Scheduler = None
 
 
-def signal_handler(signum, frame):
-    """Handle shutdown signals"""
-    logger.info(f"Received signal {signum}. Initiating graceful shutdown...")
-    shutdown_event.set()
-
-
-async def start_api_server():
+async def start_api_server(order_queue: asyncio.Queue):
     """Start FastAPI server for admin panel communication"""
     import uvicorn
     from src.api.main import app
 
+    # Retried orders go straight to the running OrderWorker
+    app.state.order_queue = order_queue
+
+    # The server shares the already-running loop (uvloop when installed),
+    # so only the HTTP parser needs to be selected here
     config = uvicorn.Config(
         app,
         host=settings.api_host,
         port=settings.api_port,
+        http="httptools",
+        lifespan="on",
         log_level="info" if settings.debug else "warning"
     )
     server = uvicorn.Server(config)
+    # Signals are handled by main() - keep uvicorn from replacing those handlers
+    server.install_signal_handlers = lambda: None
     await server.serve()
 
 
+class _ShutdownRequested(Exception):
+    """Raised inside the service TaskGroup to cancel all running services"""
+
+
+async def _wait_for_shutdown():
+    """Wait for shutdown signal, then unwind the service TaskGroup"""
+    await shutdown_event.wait()
+    logger.info("Shutdown signal received. Initiating graceful shutdown...")
+    raise _ShutdownRequested
+
+
 async def main():
     """Main entry point"""
     global email_worker, order_worker, scheduler
@@ -63,17 +94,21 @@ async def main():
     # Setup logging
     setup_logging()
 
-    logger.info("=" * 60)
-    logger.info(f"  KolayRobot Robot Service v{settings.app_version}")
-    logger.info(f"  Environment: {settings.environment}")
-    logger.info(f"  Debug: {settings.debug}")
-    logger.info("=" * 60)
+    logger.info("\n".join([
+        _BANNER,
+        f"  KolayRobot Robot Service v{settings.app_version}",
+        f"  Environment: {settings.environment}",
+        f"  Debug: {settings.debug}",
+        _BANNER,
+    ]))
 
-    # Register signal handlers
-    signal.signal(signal.SIGTERM, signal_handler)
-    signal.signal(signal.SIGINT, signal_handler)
+    # Register signal handlers on the running loop (wakes the selector directly)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, shutdown_event.set)
 
-    tasks = []
+    robot_pool = None
+    http_client = httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
 
     try:
         # Initialize database
@@ -81,39 +116,50 @@ async def main():
         await init_db()
         logger.info("Database initialized")
 
-        # Initialize workers
-        email_worker = EmailWorker()
-        order_worker = OrderWorker()
-        scheduler = Scheduler()
+        # Initialize workers (orders flow email -> order worker in memory)
+        order_queue: asyncio.Queue = asyncio.Queue(maxsize=ORDER_QUEUE_MAXSIZE)
+        # forkserver: children don't inherit the parent's loop/OpenSSL state
+        robot_pool = ProcessPoolExecutor(
+            max_workers=ROBOT_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver"),
+            # Children start with loguru's default stderr sink - add the log files
+            initializer=setup_logging
+        )
+        email_worker = EmailWorker(order_queue=order_queue)
+        order_worker = OrderWorker(order_queue=order_queue, pool=robot_pool)
+        scheduler = Scheduler(http_client=http_client)
 
         # Start scheduler (non-async, starts in background)
         logger.info("Starting scheduler...")
         scheduler.start()
 
-        # Start workers as async tasks
-        logger.info("Starting email worker...")
-        email_task = asyncio.create_task(email_worker.start())
-        tasks.append(email_task)
+        # Any service failing (or the shutdown signal) cancels the others
+        async with asyncio.TaskGroup() as tg:
+            logger.info("Starting email worker...")
+            tg.create_task(email_worker.start())
 
-        logger.info("Starting order worker...")
-        order_task = asyncio.create_task(order_worker.start())
-        tasks.append(order_task)
+            logger.info("Starting order worker...")
+            tg.create_task(order_worker.start())
 
-        # Start API server
-        logger.info(f"Starting API server on {settings.api_host}:{settings.api_port}...")
-        api_task = asyncio.create_task(start_api_server())
-        tasks.append(api_task)
+            # Start API server
+            loop_module = type(asyncio.get_running_loop()).__module__
+            logger.info(f"Starting API server on {settings.api_host}:{settings.api_port} (loop: {loop_module})...")
+            tg.create_task(start_api_server(order_queue))
 
-        logger.info("=" * 60)
-        logger.info("  All services started successfully!")
-        logger.info("  Press Ctrl+C to stop")
-        logger.info("=" * 60)
+            logger.info("\n".join([
+                _BANNER,
+                "  All services started successfully!",
+                "  Press Ctrl+C to stop",
+                _BANNER,
+            ]))
 
-        # Wait for shutdown signal
-        await shutdown_event.wait()
+            tg.create_task(_wait_for_shutdown())
 
-    except Exception as e:
-        logger.exception(f"Fatal error: {e}")
+    except* _ShutdownRequested:
+        pass
+
+    except* Exception as eg:
+        logger.exception(f"Fatal error: {eg}")
         raise
 
     finally:
@@ -129,24 +175,27 @@ async def main():
         if scheduler:
             scheduler.stop()
 
-        # Cancel remaining tasks
-        for task in tasks:
-            if not task.done():
-                task.cancel()
-                try:
-                    await task
-                except asyncio.CancelledError:
-                    pass
+        if robot_pool:
+            # Queued robots are dropped; in-flight ones were flagged FAILED by the
+            # order worker - wait for their processes without blocking the loop
+            await asyncio.to_thread(robot_pool.shutdown, wait=True, cancel_futures=True)
+
+        await http_client.aclose()
 
         # Close database
         await close_db()
 
-        logger.info("=" * 60)
-        logger.info("  Shutdown complete")
-        logger.info("=" * 60)
+        logger.info("\n".join([_BANNER, "  Shutdown complete", _BANNER]))
 
 
 if __name__ == "__main__":
+    # Prefer libuv-backed event loop when available
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
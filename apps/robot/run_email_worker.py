@@ -21,16 +21,13 @@ from src.workers.email_worker import EmailWorker
 # Graceful shutdown event
 shutdown_event = asyncio.Event()
 
+# Startup/shutdown banner rule (each banner is logged as one record)
+_BANNER = "=" * 60
+
 # Global worker instance
 email_worker: EmailWorker = None
 
 
-def signal_handler(signum, frame):
-    """Handle shutdown signals"""
-    logger.info(f"Received signal {signum}. Initiating graceful shutdown...")
-    shutdown_event.set()
-
-
 async def main():
     """Main entry point for email worker"""
     global email_worker
@@ -38,15 +35,18 @@ async def main():
     # Setup logging
     setup_logging()
 
-    logger.info("=" * 60)
-    logger.info(f"  KolayRobot Email Worker v{settings.app_version}")
-    logger.info(f"  Environment: {settings.environment}")
-    logger.info(f"  Poll Interval: {settings.email.poll_interval}s")
-    logger.info("=" * 60)
+    logger.info("\n".join([
+        _BANNER,
+        f"  KolayRobot Email Worker v{settings.app_version}",
+        f"  Environment: {settings.environment}",
+        f"  Poll Interval: {settings.email.poll_interval}s",
+        _BANNER,
+    ]))
 
-    # Register signal handlers
-    signal.signal(signal.SIGTERM, signal_handler)
-    signal.signal(signal.SIGINT, signal_handler)
+    # Register signal handlers on the running loop (wakes the selector directly)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, shutdown_event.set)
 
     try:
         # Initialize database
@@ -61,13 +61,16 @@ async def main():
         logger.info("Starting email worker...")
         worker_task = asyncio.create_task(email_worker.start())
 
-        logger.info("=" * 60)
-        logger.info("  Email worker started successfully!")
-        logger.info("  Press Ctrl+C to stop")
-        logger.info("=" * 60)
+        logger.info("\n".join([
+            _BANNER,
+            "  Email worker started successfully!",
+            "  Press Ctrl+C to stop",
+            _BANNER,
+        ]))
 
         # Wait for shutdown signal
         await shutdown_event.wait()
+        logger.info("Shutdown signal received. Initiating graceful shutdown...")
 
     except Exception as e:
         logger.exception(f"Fatal error: {e}")
@@ -91,9 +94,7 @@ async def main():
         # Close database
         await close_db()
 
-        logger.info("=" * 60)
-        logger.info("  Email worker shutdown complete")
-        logger.info("=" * 60)
+        logger.info("\n".join([_BANNER, "  Email worker shutdown complete", _BANNER]))
 
 
 if __name__ == "__main__":
@@ -2,10 +2,14 @@
 JWT Authentication module for KolayRobot API
 """
 
-from datetime import datetime, timedelta
-from typing import Optional
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 import hashlib
 import secrets
+import time
 import os
 
 # Load environment variables from .env file
@@ -14,10 +18,11 @@ load_dotenv()
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
-from pydantic import BaseModel
+import jwt
+from pydantic import BaseModel, ConfigDict
 
 from src.config import settings
+from src.utils.logger import logger
 
 # JWT Settings - Generate random secret if not configured
 SECRET_KEY = settings.jwt_secret_key
@@ -28,24 +33,49 @@ if SECRET_KEY == "CHANGE-ME-IN-PRODUCTION-USE-RANDOM-64-CHAR-SECRET":
     SECRET_KEY = secrets.token_hex(32)
 
 ALGORITHM = "HS256"
+
+# Reusable signer with the key encoded once (no per-call key/algorithm setup)
+_JWT = jwt.PyJWT()
+_JWT_KEY = SECRET_KEY.encode("utf-8")
+_JWT_ALGORITHMS = [ALGORITHM]
+_JWT_DECODE_OPTIONS = {"require": ["exp", "sub"], "verify_aud": False}
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 8  # 8 hours (reduced from 24 for security)
+ACCESS_TOKEN_EXPIRE_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Verified token cache: blake2b(token) -> (username, exp epoch)
+# Skips HMAC verification + JSON parsing for tokens seen recently
+_TOKEN_CACHE_TTL_SECONDS = 60
+_TOKEN_CACHE_MAX_SIZE = 10000
+_token_cache: Dict[bytes, Tuple[str, float, float]] = {}
+
+# Resolved users for authenticated requests: username -> (user, cached_until)
+# Saves a SQL Server lookup per request; user edits/deletes invalidate the entry
+_USER_CACHE_TTL_SECONDS = 60
+_USER_CACHE_MAX_SIZE = 1024
+_user_cache: Dict[str, Tuple["UserInDB", float]] = {}
 
-# Models
+
+# Models (immutable - built once per request and never modified)
 class Token(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     access_token: str
     token_type: str
     expires_in: int
 
 
 class TokenData(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     username: Optional[str] = None
 
 
 class User(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     username: str
     disabled: bool = False
 
@@ -58,6 +88,28 @@ class UserInDB(User):
 # Use random per-password salt stored with hash
 PASSWORD_SALT_LENGTH = 16
 PASSWORD_ITERATIONS = 100000  # OWASP recommended minimum
+PASSWORD_HASH_LENGTH = 32  # SHA256 digest size
+
+# Dedicated, bounded pool for PBKDF2 work (hashlib releases the GIL, so hashes
+# run in parallel) - a login storm can't exhaust the shared request threadpool
+_HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="pbkdf2")
+
+# Logins currently being checked: (username, sha256(password)) -> shared future
+# Identical concurrent attempts await one PBKDF2 run instead of starting their own
+_AUTH_IN_FLIGHT_MAX_SIZE = 1000
+_auth_in_flight: Dict[Tuple[str, bytes], asyncio.Future] = {}
+
+
+def _pbkdf2(password: str, salt: bytes) -> bytes:
+    """Derive the raw PBKDF2-SHA256 digest (single OpenSSL call)"""
+    return hashlib.pbkdf2_hmac(
+        'sha256',
+        password.encode('utf-8'),
+        salt,
+        PASSWORD_ITERATIONS,
+        dklen=PASSWORD_HASH_LENGTH
+    )
+
 
 def hash_password(password: str, salt: bytes = None) -> str:
     """
@@ -67,26 +119,27 @@ def hash_password(password: str, salt: bytes = None) -> str:
     if salt is None:
         salt = secrets.token_bytes(PASSWORD_SALT_LENGTH)
 
-    # Use PBKDF2 with SHA256
-    dk = hashlib.pbkdf2_hmac(
-        'sha256',
-        password.encode('utf-8'),
-        salt,
-        PASSWORD_ITERATIONS
-    )
+    dk = _pbkdf2(password, salt)
     return f"{salt.hex()}:{dk.hex()}"
 
 
+@lru_cache(maxsize=1024)
+def _parse_stored_hash(stored_hash: str) -> Tuple[bytes, bytes]:
+    """Split 'salt:hash' hex string into raw (salt, digest) bytes"""
+    salt_hex, hash_hex = stored_hash.split(':')
+    return bytes.fromhex(salt_hex), bytes.fromhex(hash_hex)
+
+
 def verify_password_hash(password: str, stored_hash: str) -> bool:
     """Verify password against stored PBKDF2 hash"""
     try:
-        salt_hex, hash_hex = stored_hash.split(':')
-        salt = bytes.fromhex(salt_hex)
-        expected_hash = hash_password(password, salt)
-        return secrets.compare_digest(expected_hash, stored_hash)
-    except (ValueError, AttributeError):
+        salt, expected = _parse_stored_hash(stored_hash)
+    except (ValueError, AttributeError, TypeError):
         return False
 
+    # Compare raw digests - no hex re-encoding of the derived key
+    return secrets.compare_digest(_pbkdf2(password, salt), expected)
+
 
 # Admin password - generate secure hash at startup
 # Default admin password: read from ADMIN_PASSWORD env var or generate random
@@ -108,6 +161,11 @@ ADMIN_USERS = {
     }
 }
 
+# Validated once at import - get_user returns these shared instances
+_ADMIN_USERS_CACHED: Dict[str, UserInDB] = {
+    username: UserInDB(**user_dict) for username, user_dict in ADMIN_USERS.items()
+}
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
@@ -119,12 +177,22 @@ def get_password_hash(password: str) -> str:
     return hash_password(password)
 
 
+async def _run_in_hash_pool(func, *args):
+    """Run password hashing work on the dedicated PBKDF2 pool"""
+    return await asyncio.get_running_loop().run_in_executor(_HASH_POOL, func, *args)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password for storage without blocking the event loop"""
+    return await _run_in_hash_pool(hash_password, password)
+
+
 def get_user(username: str) -> Optional[UserInDB]:
     """Get user from SQL Server database"""
     # Check hardcoded admin users first (fallback)
-    if username in ADMIN_USERS:
-        user_dict = ADMIN_USERS[username]
-        return UserInDB(**user_dict)
+    admin_user = _ADMIN_USERS_CACHED.get(username)
+    if admin_user is not None:
+        return admin_user
 
     # Check users from SQL Server
     try:
@@ -138,7 +206,7 @@ def get_user(username: str) -> Optional[UserInDB]:
             )
     except Exception as e:
         # Log error but don't fail
-        print(f"Warning: Could not fetch user from database: {e}")
+        logger.warning(f"Could not fetch user from database: {e}")
 
     return None
 
@@ -153,18 +221,90 @@ def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
     return user
 
 
+async def authenticate_user_async(username: str, password: str) -> Optional[UserInDB]:
+    """Authenticate a user on the hash pool (PBKDF2 + DB lookup would block the event loop)"""
+    key = (username, hashlib.sha256(password.encode('utf-8')).digest())
+
+    pending = _auth_in_flight.get(key)
+    if pending is not None:
+        # shield: one caller disconnecting must not cancel the others' result
+        return await asyncio.shield(pending)
+
+    if len(_auth_in_flight) >= _AUTH_IN_FLIGHT_MAX_SIZE:
+        return await _run_in_hash_pool(authenticate_user, username, password)
+
+    future = asyncio.ensure_future(_run_in_hash_pool(authenticate_user, username, password))
+    _auth_in_flight[key] = future
+    future.add_done_callback(lambda _: _auth_in_flight.pop(key, None))
+    return await asyncio.shield(future)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
+    # Integer epoch is what ends up in the token anyway (no datetime round-trip)
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        lifetime = int(expires_delta.total_seconds())
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+        lifetime = ACCESS_TOKEN_EXPIRE_SECONDS
+    to_encode["exp"] = int(time.time()) + lifetime
+    encoded_jwt = _JWT.encode(to_encode, _JWT_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def _decode_token_cached(token: str) -> Optional[str]:
+    """Decode JWT and return its subject, using the verified token cache"""
+    now = time.time()
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached = _token_cache.get(cache_key)
+    if cached is not None:
+        username, exp, cached_until = cached
+        if exp > now and cached_until > now:
+            return username
+        _token_cache.pop(cache_key, None)
+        if exp <= now:
+            return None
+
+    try:
+        payload = _JWT.decode(token, _JWT_KEY, algorithms=_JWT_ALGORITHMS, options=_JWT_DECODE_OPTIONS)
+    except jwt.PyJWTError:
+        return None
+
+    username = payload.get("sub")
+    if username is None:
+        return None
+    token_data = TokenData(username=username)
+
+    if len(_token_cache) >= _TOKEN_CACHE_MAX_SIZE:
+        _token_cache.clear()
+    exp = float(payload.get("exp", now))
+    _token_cache[cache_key] = (token_data.username, exp, now + _TOKEN_CACHE_TTL_SECONDS)
+    return token_data.username
+
+
+def _get_user_cached(username: str) -> Optional[UserInDB]:
+    """get_user with a short-lived cache (request authentication path)"""
+    now = time.monotonic()
+    cached = _user_cache.get(username)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    user = get_user(username)
+    if user is None:
+        _user_cache.pop(username, None)
+        return None
+
+    if len(_user_cache) >= _USER_CACHE_MAX_SIZE:
+        _user_cache.clear()
+    _user_cache[username] = (user, now + _USER_CACHE_TTL_SECONDS)
+    return user
+
+
+def invalidate_user_cache(username: str) -> None:
+    """Drop a cached user after it was modified or deleted"""
+    _user_cache.pop(username, None)
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     """Get current user from JWT token"""
     credentials_exception = HTTPException(
@@ -172,16 +312,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
+    username = _decode_token_cached(token)
+    if username is None:
         raise credentials_exception
 
-    user = get_user(username=token_data.username)
+    user = _get_user_cached(username)
     if user is None:
         raise credentials_exception
     return user
@@ -7,38 +7,112 @@ FastAPI application for admin panel communication
 from dotenv import load_dotenv
 load_dotenv()
 
+from contextlib import asynccontextmanager
+from itertools import count
+from operator import itemgetter
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Query, Depends
+from typing import Dict, List, Optional, Tuple
+from email.header import decode_header
+from email.utils import decode_rfc2231
+from urllib.parse import unquote
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, Response
+import asyncio
+import base64
+import gzip
+import heapq
+import orjson
 import os
+import quopri
+import re
+import threading
+import uuid
 from fastapi.security import OAuth2PasswordRequestForm
-from pydantic import BaseModel
+from starlette.routing import Route
+from pydantic import BaseModel, ConfigDict
 
 from src.config import settings
+from src.utils.logger import logger
 
 from src.api.auth import (
-    authenticate_user,
+    authenticate_user_async,
     create_access_token,
     get_current_active_user,
-    get_password_hash,
+    get_password_hash_async,
+    invalidate_user_cache,
     Token,
     User,
-    ACCESS_TOKEN_EXPIRE_MINUTES,
+    ACCESS_TOKEN_EXPIRE_SECONDS,
 )
-from src.notifications.email_sender import EmailSender, generate_random_password
+from src.notifications.email_sender import email_sender, generate_random_password
 
 # Import SQL Server database helper
 from src.db.sqlserver import db as sqlserver_db
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup/shutdown"""
+    # Warm the SQL Server pool so the first request doesn't open a connection
+    try:
+        await run_in_threadpool(sqlserver_db.warm_pool)
+    except Exception as e:
+        logger.warning(f"Database pool warmup failed: {e}")
+
+    # Secondary indexes for the paginated (newest first) order/email lists
+    try:
+        await run_in_threadpool(sqlserver_db.ensure_list_indexes)
+    except Exception as e:
+        logger.warning(f"Could not create list indexes: {e}")
+
+    # Apply template edits saved in SQL Server over the built-in defaults
+    try:
+        await run_in_threadpool(_load_saved_templates)
+    except Exception as e:
+        logger.warning(f"Could not load saved email templates: {e}")
+
+    # Build the OpenAPI schema once instead of on the first docs hit
+    if settings.debug:
+        _prepare_openapi()
+
+    notification_workers = [
+        asyncio.create_task(_notification_worker()),
+        asyncio.create_task(_order_coalesce_worker()),
+    ]
+
+    yield
+
+    for task in notification_workers:
+        task.cancel()
+    await asyncio.gather(*notification_workers, return_exceptions=True)
+
+    # Send whatever was still queued (or coalescing) before closing the SMTP sessions
+    _flush_order_windows(force=True)
+    pending = []
+    while not _notification_queue.empty():
+        pending.append(_notification_queue.get_nowait())
+    if pending:
+        try:
+            await _dispatch_notifications(pending)
+        except Exception as e:
+            logger.error(f"[NOTIFICATION] Failed to send {len(pending)} queued notification(s): {e}")
+
+    sqlserver_db.close_pool()
+    email_sender.close()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="KolayRobot API",
     description="Order Automation System API",
     version=settings.app_version,
-    docs_url="/api/docs" if settings.debug else None,
-    redoc_url="/api/redoc" if settings.debug else None,
+    # Docs and schema are served from precomputed bytes in debug only (see end of file)
+    docs_url=None,
+    redoc_url=None,
+    openapi_url=None,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 # CORS middleware - Restrict to allowed origins
@@ -50,12 +124,15 @@ ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",             # Local development alt
 ]
 
+# frozenset: O(1) origin membership check per request
+# max_age: let browsers cache preflight results (Chrome caps at 2 hours)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=ALLOWED_ORIGINS,
+    allow_origins=frozenset(ALLOWED_ORIGINS),
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_methods=("GET", "POST", "PUT", "DELETE", "PATCH"),
+    allow_headers=("Authorization", "Content-Type"),
+    max_age=7200,
 )
 
 
@@ -63,14 +140,14 @@ app.add_middleware(
 # MODELS
 # ============================================
 
-class HealthResponse(BaseModel):
-    status: str
-    timestamp: str
-    version: str
-    services: dict
+# Response models are never mutated after validation. Extra keys stay allowed
+# (ignored) because handlers return raw DB rows with additional columns.
+_RESPONSE_MODEL_CONFIG = ConfigDict(frozen=True)
 
 
 class OrderResponse(BaseModel):
+    model_config = _RESPONSE_MODEL_CONFIG
+
     id: str
     order_code: str
     supplier_type: str
@@ -88,6 +165,8 @@ class OrderResponse(BaseModel):
 
 
 class OrderListResponse(BaseModel):
+    model_config = _RESPONSE_MODEL_CONFIG
+
     orders: List[OrderResponse]
     total: int
     page: int
@@ -95,6 +174,8 @@ class OrderListResponse(BaseModel):
 
 
 class EmailResponse(BaseModel):
+    model_config = _RESPONSE_MODEL_CONFIG
+
     id: str
     subject: str
     from_address: str
@@ -105,6 +186,8 @@ class EmailResponse(BaseModel):
 
 
 class StatsResponse(BaseModel):
+    model_config = _RESPONSE_MODEL_CONFIG
+
     today_orders: int
     today_successful: int
     today_failed: int
@@ -122,6 +205,8 @@ class ManualOrderRequest(BaseModel):
 
 
 class UserResponse(BaseModel):
+    model_config = _RESPONSE_MODEL_CONFIG
+
     id: int
     username: str
     email: str
@@ -149,6 +234,8 @@ class UpdateUserRequest(BaseModel):
 
 
 class TemplateResponse(BaseModel):
+    model_config = _RESPONSE_MODEL_CONFIG
+
     id: int
     name: str
     subject: str
@@ -216,12 +303,13 @@ def _clear_attempts(ip: str) -> None:
 # AUTH ENDPOINTS
 # ============================================
 
-def _create_login_response(username: str, password: str, client_ip: str = "unknown") -> dict:
+async def _create_login_response(username: str, password: str, client_ip: str = "unknown") -> dict:
     """Helper function to authenticate and create token response"""
     # Check rate limit
     _check_rate_limit(client_ip)
 
-    user = authenticate_user(username, password)
+    logger.bind(username=username, client_ip=client_ip).debug("Login attempt")
+    user = await authenticate_user_async(username, password)
     if not user:
         # Record failed attempt
         _record_failed_attempt(client_ip)
@@ -234,14 +322,12 @@ def _create_login_response(username: str, password: str, client_ip: str = "unkno
     # Clear attempts on success
     _clear_attempts(client_ip)
 
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
+    # Default lifetime - no per-login timedelta
+    access_token = create_access_token(data={"sub": user.username})
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "expires_in": ACCESS_TOKEN_EXPIRE_SECONDS,
     }
 
 
@@ -256,7 +342,7 @@ async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends
     Rate limited: 5 attempts per 5 minutes, 15 minute lockout.
     """
     client_ip = request.client.host if request.client else "unknown"
-    return _create_login_response(form_data.username, form_data.password, client_ip)
+    return await _create_login_response(form_data.username, form_data.password, client_ip)
 
 
 @app.post("/api/auth/login/json", response_model=Token)
@@ -267,7 +353,7 @@ async def login_json(request: Request, login_data: LoginRequest):
     Rate limited: 5 attempts per 5 minutes, 15 minute lockout.
     """
     client_ip = request.client.host if request.client else "unknown"
-    return _create_login_response(login_data.username, login_data.password, client_ip)
+    return await _create_login_response(login_data.username, login_data.password, client_ip)
 
 
 @app.get("/api/auth/me")
@@ -280,29 +366,14 @@ class ForgotPasswordRequest(BaseModel):
     email: str
 
 
-@app.post("/api/auth/forgot-password")
-async def forgot_password(request: ForgotPasswordRequest):
-    """Send password reset email"""
-    try:
-        # Find user by email in SQL Server
-        user = sqlserver_db.get_user_by_email(request.email)
-        if user:
-            # Generate new password
-            new_password = generate_random_password()
-
-            # Update password in database
-            sqlserver_db.update_user(user["id"], hashed_password=get_password_hash(new_password))
-
-            # Send email
-            email_sender = EmailSender()
-            email_sent = email_sender.send_email(
-                to=request.email,
-                subject="KolayRobot - Şifre Sıfırlama",
-                body=f"""Merhaba {user.get('full_name', user['username'])},
+# Static text around the two per-user fields of the password reset email
+_RESET_BODY_HEAD = "Merhaba "
+_RESET_BODY_MID = """,
 
 Şifre sıfırlama talebiniz alındı.
 
-Yeni geçici şifreniz: {new_password}
+Yeni geçici şifreniz: """
+_RESET_BODY_TAIL = """
 
 Lütfen giriş yaptıktan sonra şifrenizi değiştirin.
 
@@ -310,6 +381,40 @@ Giriş adresi: https://kolayrobot.com/login
 
 İyi çalışmalar,
 KolayRobot Ekibi"""
+
+
+def _send_password_reset_email(to: str, full_name: str, new_password: str):
+    """Send the password reset email (runs as a background task after the response)"""
+    email_sender.send_email(
+        to=to,
+        subject="KolayRobot - Şifre Sıfırlama",
+        body="".join((_RESET_BODY_HEAD, full_name, _RESET_BODY_MID, new_password, _RESET_BODY_TAIL))
+    )
+
+
+@app.post("/api/auth/forgot-password")
+async def forgot_password(request: ForgotPasswordRequest, background_tasks: BackgroundTasks):
+    """Send password reset email"""
+    try:
+        # Find user by email in SQL Server (indexed lookup)
+        user = sqlserver_db.get_user_by_email(request.email)
+
+        # Always generate and hash a password, even for unknown emails, so the
+        # response time doesn't reveal which addresses are registered
+        new_password = generate_random_password()
+        hashed_password = await get_password_hash_async(new_password)
+
+        if user:
+            # Update password in database
+            sqlserver_db.update_user(user["id"], hashed_password=hashed_password)
+            invalidate_user_cache(user["username"])
+
+            # Send email after the response - SMTP must not hold up the request
+            background_tasks.add_task(
+                _send_password_reset_email,
+                request.email,
+                user.get('full_name') or user['username'],
+                new_password
             )
 
         # Return same message even if user not found (security)
@@ -329,151 +434,72 @@ KolayRobot Ekibi"""
 # ENDPOINTS (Protected)
 # ============================================
 
-@app.get("/api/health", response_model=HealthResponse)
-async def health_check():
-    """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
-        "version": settings.app_version,
-        "services": {
-            "api": "running",
-            "email_worker": "running",  # TODO: Check actual status
-            "order_worker": "running",  # TODO: Check actual status
-            "scheduler": "running",  # TODO: Check actual status
-        }
-    }
+# Static part of the health payload (only the timestamp changes)
+_HEALTH_SERVICES = {
+    "api": "running",
+    "email_worker": "running",  # TODO: Check actual status
+    "order_worker": "running",  # TODO: Check actual status
+    "scheduler": "running",  # TODO: Check actual status
+}
+
+# Serialized health payload, rebuilt at most once per second: (epoch second, JSON bytes)
+_health_payload = (0, b"")
+
+
+async def health_check(request: Request):
+    """Health check endpoint (plain Starlette route - no dependencies/validation)"""
+    global _health_payload
+    now = int(time.time())
+    if _health_payload[0] != now:
+        _health_payload = (now, orjson.dumps({
+            "status": "healthy",
+            "timestamp": datetime.fromtimestamp(now, tz=timezone.utc).isoformat(),
+            "version": settings.app_version,
+            "services": _HEALTH_SERVICES,
+        }))
+    return Response(content=_health_payload[1], media_type="application/json")
+
+
+# First in the route table so load balancer probes match before any API route
+app.router.routes.insert(0, Route("/api/health", health_check, methods=["GET"]))
 
 
 # In-memory storage (initialized before endpoints that use them)
 _emails_db: List[dict] = []
 
-_orders_db: List[dict] = [
-    {
-        "id": "ord-001",
-        "order_code": "ORD-2026-00001",
-        "supplier_type": "mutlu_aku",
-        "status": "completed",
-        "customer_name": "CASTROL BATMAN DALAY PETROL",
-        "item_count": 12,
-        "total_amount": 45600.00,
-        "created_at": (datetime.utcnow() - timedelta(hours=2)).isoformat(),
-        "completed_at": (datetime.utcnow() - timedelta(hours=1)).isoformat(),
-        "error_message": None,
-    },
-    {
-        "id": "ord-002",
-        "order_code": "ORD-2026-00002",
-        "supplier_type": "mann_hummel",
-        "status": "completed",
-        "customer_name": "TRM56062",
-        "item_count": 45,
-        "total_amount": 12350.00,
-        "created_at": (datetime.utcnow() - timedelta(hours=3)).isoformat(),
-        "completed_at": (datetime.utcnow() - timedelta(hours=2)).isoformat(),
-        "error_message": None,
-    },
-    {
-        "id": "ord-003",
-        "order_code": "ORD-2026-00003",
-        "supplier_type": "mutlu_aku",
-        "status": "failed",
-        "customer_name": "CASTROL BATMAN DALAY PETROL",
-        "item_count": 8,
-        "total_amount": 28400.00,
-        "created_at": (datetime.utcnow() - timedelta(hours=4)).isoformat(),
-        "completed_at": None,
-        "error_message": "SAP onay butonu bulunamadı",
-    },
-    {
-        "id": "ord-004",
-        "order_code": "ORD-2026-00004",
-        "supplier_type": "mann_hummel",
-        "status": "processing",
-        "customer_name": "TRM56018",
-        "item_count": 22,
-        "total_amount": 8900.00,
-        "created_at": (datetime.utcnow() - timedelta(minutes=30)).isoformat(),
-        "completed_at": None,
-        "error_message": None,
-    },
-    {
-        "id": "ord-005",
-        "order_code": "ORD-2026-00005",
-        "supplier_type": "mutlu_aku",
-        "status": "pending",
-        "customer_name": "CASTROL BATMAN DALAY PETROL",
-        "item_count": 15,
-        "total_amount": 52100.00,
-        "created_at": (datetime.utcnow() - timedelta(minutes=10)).isoformat(),
-        "completed_at": None,
-        "error_message": None,
-    },
-]
+# Incremental IMAP sync state for _emails_db (reset when UIDVALIDITY changes)
+_imap_state = {"uidvalidity": None, "max_uid": 0}
 
-# Audit logs - user actions
-_audit_logs_db: List[dict] = [
-    {"id": "audit-001", "user": "admin", "action": "login", "resource_type": "auth", "resource_id": None, "details": "Kullanıcı giriş yaptı", "timestamp": (datetime.utcnow() - timedelta(hours=1)).isoformat(), "ip_address": "192.168.1.100"},
-    {"id": "audit-002", "user": "admin", "action": "view_orders", "resource_type": "order", "resource_id": None, "details": "Sipariş listesi görüntülendi", "timestamp": (datetime.utcnow() - timedelta(minutes=45)).isoformat(), "ip_address": "192.168.1.100"},
-    {"id": "audit-003", "user": "admin", "action": "view_order", "resource_type": "order", "resource_id": "ord-001", "details": "Sipariş detayı görüntülendi: ORD-2026-00001", "timestamp": (datetime.utcnow() - timedelta(minutes=30)).isoformat(), "ip_address": "192.168.1.100"},
-    {"id": "audit-004", "user": "admin", "action": "fetch_emails", "resource_type": "email", "resource_id": None, "details": "E-postalar IMAP'tan çekildi", "timestamp": (datetime.utcnow() - timedelta(minutes=20)).isoformat(), "ip_address": "192.168.1.100"},
-]
 
-# Order operation logs - step by step robot actions
-_order_logs_db: List[dict] = [
-    # ord-001 (completed - mutlu_aku)
-    {"id": "log-001-01", "order_id": "ord-001", "step": 1, "action": "portal_open", "message": "Mutlu Akü portalı açılıyor...", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=2, minutes=5)).isoformat()},
-    {"id": "log-001-02", "order_id": "ord-001", "step": 2, "action": "login", "message": "Giriş yapılıyor: burak.bakar@castrol.com", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=2, minutes=4)).isoformat()},
-    {"id": "log-001-03", "order_id": "ord-001", "step": 3, "action": "customer_select", "message": "Müşteri seçiliyor: CASTROL BATMAN DALAY PETROL", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=2, minutes=3)).isoformat()},
-    {"id": "log-001-04", "order_id": "ord-001", "step": 4, "action": "menu_navigate", "message": "Menü: Satış/Satın Alma > Satın Alma Siparişi", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=2, minutes=2)).isoformat()},
-    {"id": "log-001-05", "order_id": "ord-001", "step": 5, "action": "form_create", "message": "Yeni sipariş formu oluşturuluyor...", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=2, minutes=1)).isoformat()},
-    {"id": "log-001-06", "order_id": "ord-001", "step": 6, "action": "form_fill", "message": "Form dolduruldu - Depo: Merkez, Ödeme: 60 Gün", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=1, minutes=58)).isoformat()},
-    {"id": "log-001-07", "order_id": "ord-001", "step": 7, "action": "products_tab", "message": "Ürünler sekmesine geçiliyor...", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=1, minutes=55)).isoformat()},
-    {"id": "log-001-08", "order_id": "ord-001", "step": 8, "action": "products_add", "message": "12 ürün eklendi, toplam: ₺45.600", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=1, minutes=45)).isoformat()},
-    {"id": "log-001-09", "order_id": "ord-001", "step": 9, "action": "order_save", "message": "Sipariş kaydediliyor...", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=1, minutes=10)).isoformat()},
-    {"id": "log-001-10", "order_id": "ord-001", "step": 10, "action": "sap_confirm", "message": "SAP onayı gönderildi", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=1, minutes=5)).isoformat()},
-    {"id": "log-001-11", "order_id": "ord-001", "step": 11, "action": "complete", "message": "Sipariş başarıyla tamamlandı: SAP-2026-00001", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=1)).isoformat()},
-
-    # ord-002 (completed - mann_hummel)
-    {"id": "log-002-01", "order_id": "ord-002", "step": 1, "action": "portal_open", "message": "TecCom portalı açılıyor...", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=3, minutes=5)).isoformat()},
-    {"id": "log-002-02", "order_id": "ord-002", "step": 2, "action": "login", "message": "Giriş yapılıyor: dilsad.kaptan@dorufinansal.com", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=3, minutes=4)).isoformat()},
-    {"id": "log-002-03", "order_id": "ord-002", "step": 3, "action": "menu_navigate", "message": "Menü: Sorgulama ve sipariş > Dosya Yükle", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=3, minutes=3)).isoformat()},
-    {"id": "log-002-04", "order_id": "ord-002", "step": 4, "action": "csv_generate", "message": "CSV dosyası oluşturuldu: 45 ürün", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=3, minutes=2)).isoformat()},
-    {"id": "log-002-05", "order_id": "ord-002", "step": 5, "action": "file_upload", "message": "Siparis_formu_TecOrder_2018.csv yükleniyor...", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=3, minutes=1)).isoformat()},
-    {"id": "log-002-06", "order_id": "ord-002", "step": 6, "action": "supplier_select", "message": "Tedarikçi seçildi: FILTRON-MANN+HUMMEL Türkiye", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=2, minutes=55)).isoformat()},
-    {"id": "log-002-07", "order_id": "ord-002", "step": 7, "action": "customer_select", "message": "Müşteri seçildi: TRM56062", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=2, minutes=50)).isoformat()},
-    {"id": "log-002-08", "order_id": "ord-002", "step": 8, "action": "order_submit", "message": "TALEP → SİPARİŞ butonu tıklandı", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=2, minutes=10)).isoformat()},
-    {"id": "log-002-09", "order_id": "ord-002", "step": 9, "action": "complete", "message": "Sipariş başarıyla tamamlandı: TEC-2026-00002", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=2)).isoformat()},
-
-    # ord-003 (failed - mutlu_aku)
-    {"id": "log-003-01", "order_id": "ord-003", "step": 1, "action": "portal_open", "message": "Mutlu Akü portalı açılıyor...", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=4, minutes=5)).isoformat()},
-    {"id": "log-003-02", "order_id": "ord-003", "step": 2, "action": "login", "message": "Giriş yapılıyor: burak.bakar@castrol.com", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=4, minutes=4)).isoformat()},
-    {"id": "log-003-03", "order_id": "ord-003", "step": 3, "action": "customer_select", "message": "Müşteri seçiliyor: CASTROL BATMAN DALAY PETROL", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=4, minutes=3)).isoformat()},
-    {"id": "log-003-04", "order_id": "ord-003", "step": 4, "action": "menu_navigate", "message": "Menü: Satış/Satın Alma > Satın Alma Siparişi", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=4, minutes=2)).isoformat()},
-    {"id": "log-003-05", "order_id": "ord-003", "step": 5, "action": "form_create", "message": "Yeni sipariş formu oluşturuluyor...", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=4, minutes=1)).isoformat()},
-    {"id": "log-003-06", "order_id": "ord-003", "step": 6, "action": "form_fill", "message": "Form dolduruldu - Depo: Merkez, Ödeme: 60 Gün", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=3, minutes=58)).isoformat()},
-    {"id": "log-003-07", "order_id": "ord-003", "step": 7, "action": "products_tab", "message": "Ürünler sekmesine geçiliyor...", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=3, minutes=55)).isoformat()},
-    {"id": "log-003-08", "order_id": "ord-003", "step": 8, "action": "products_add", "message": "8 ürün eklendi, toplam: ₺28.400", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=3, minutes=45)).isoformat()},
-    {"id": "log-003-09", "order_id": "ord-003", "step": 9, "action": "order_save", "message": "Sipariş kaydediliyor...", "status": "success", "timestamp": (datetime.utcnow() - timedelta(hours=3, minutes=40)).isoformat()},
-    {"id": "log-003-10", "order_id": "ord-003", "step": 10, "action": "sap_confirm", "message": "SAP onay butonu bulunamadı - 3 deneme yapıldı", "status": "error", "timestamp": (datetime.utcnow() - timedelta(hours=3, minutes=35)).isoformat(), "screenshot": "ord-003_sap_confirm_error.png"},
-
-    # ord-004 (processing - mann_hummel)
-    {"id": "log-004-01", "order_id": "ord-004", "step": 1, "action": "portal_open", "message": "TecCom portalı açılıyor...", "status": "success", "timestamp": (datetime.utcnow() - timedelta(minutes=30)).isoformat()},
-    {"id": "log-004-02", "order_id": "ord-004", "step": 2, "action": "login", "message": "Giriş yapılıyor: dilsad.kaptan@dorufinansal.com", "status": "success", "timestamp": (datetime.utcnow() - timedelta(minutes=29)).isoformat()},
-    {"id": "log-004-03", "order_id": "ord-004", "step": 3, "action": "menu_navigate", "message": "Menü: Sorgulama ve sipariş > Dosya Yükle", "status": "success", "timestamp": (datetime.utcnow() - timedelta(minutes=28)).isoformat()},
-    {"id": "log-004-04", "order_id": "ord-004", "step": 4, "action": "csv_generate", "message": "CSV dosyası oluşturuldu: 22 ürün", "status": "success", "timestamp": (datetime.utcnow() - timedelta(minutes=27)).isoformat()},
-    {"id": "log-004-05", "order_id": "ord-004", "step": 5, "action": "file_upload", "message": "Dosya yükleniyor...", "status": "processing", "timestamp": (datetime.utcnow() - timedelta(minutes=26)).isoformat()},
-
-    # ord-005 (pending - no logs yet)
-]
+# Dashboard stats cache: every open dashboard polls /api/stats. Holds the
+# encoded JSON body; order writes in this process (API handlers and the
+# workers, via sqlserver_db.orders_version) expire it early. Writes made
+# elsewhere are picked up within the TTL
+_STATS_CACHE_TTL_SECONDS = 30
+_stats_cache = {"expires_at": 0.0, "body": None, "orders_version": -1}
+
+
+def _invalidate_stats_cache() -> None:
+    """Expire the cached dashboard stats (after an order status change)"""
+    _stats_cache["expires_at"] = 0.0
 
 
-@app.get("/api/stats", response_model=StatsResponse)
+# Fixed-shape dict built by get_today_stats - documented, not re-validated
+@app.get("/api/stats", responses={200: {"model": StatsResponse}})
 async def get_stats(current_user: User = Depends(get_current_active_user)):
-    """Get dashboard statistics from SQL Server"""
+    """Get dashboard statistics from SQL Server (cached briefly)"""
+    now = time.monotonic()
+    orders_version = sqlserver_db.orders_version
+    if (_stats_cache["body"] is not None and _stats_cache["expires_at"] > now
+            and _stats_cache["orders_version"] == orders_version):
+        return Response(content=_stats_cache["body"], media_type="application/json")
+
     try:
-        stats = sqlserver_db.get_today_stats()
-        return stats
+        body = orjson.dumps(sqlserver_db.get_today_stats())
+        _stats_cache["body"] = body
+        _stats_cache["expires_at"] = now + _STATS_CACHE_TTL_SECONDS
+        _stats_cache["orders_version"] = orders_version
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         # Fallback to zeros on error
         return {
@@ -487,7 +513,8 @@ async def get_stats(current_user: User = Depends(get_current_active_user)):
         }
 
 
-@app.get("/api/orders", response_model=OrderListResponse)
+# List endpoints return trusted SELECT rows as-is: models document the shape only
+@app.get("/api/orders", responses={200: {"model": OrderListResponse}})
 async def list_orders(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
@@ -503,16 +530,37 @@ async def list_orders(
             page=page,
             page_size=page_size
         )
-        return {
+        return ORJSONResponse({
             "orders": orders,
             "total": total,
             "page": page,
             "page_size": page_size,
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail="Sunucu hatası oluştu")
 
 
+# Username -> users.id for audit log attribution. Ids never change for a
+# username; entries are dropped when the user is deleted
+_USER_ID_CACHE_MAX_SIZE = 1024
+_user_id_by_username: Dict[str, int] = {}
+
+
+def _get_user_id(username: str) -> Optional[int]:
+    """users.id for a username, looked up in SQL Server only on first use"""
+    user_id = _user_id_by_username.get(username)
+    if user_id is not None:
+        return user_id
+
+    user = sqlserver_db.get_user_by_username(username)
+    if not user:
+        return None
+    if len(_user_id_by_username) >= _USER_ID_CACHE_MAX_SIZE:
+        _user_id_by_username.clear()
+    _user_id_by_username[username] = user["id"]
+    return user["id"]
+
+
 @app.get("/api/orders/{order_id}", response_model=OrderResponse)
 async def get_order(order_id: str, current_user: User = Depends(get_current_active_user)):
     """Get order details from SQL Server"""
@@ -540,12 +588,20 @@ async def retry_order(order_id: str, current_user: User = Depends(get_current_ac
 
         # Update order status to pending
         sqlserver_db.update_order_status(order_id, "PENDING")
+        _invalidate_stats_cache()
+
+        # Hand the order to the running OrderWorker (set by the service entry point)
+        order_queue = getattr(app.state, "order_queue", None)
+        if order_queue is not None:
+            from src.workers.order_worker import order_info_from_row
+            try:
+                order_queue.put_nowait(order_info_from_row(order))
+            except asyncio.QueueFull:
+                logger.warning(f"Order queue full - {order['order_code']} stays PENDING until the next worker start")
 
         # Add audit log
-        user = sqlserver_db.get_user_by_username(current_user.username)
-        user_id = user["id"] if user else None
         sqlserver_db.create_audit_log(
-            user_id=user_id,
+            user_id=_get_user_id(current_user.username),
             action="order_retry",
             resource_type="order",
             resource_id=order_id,
@@ -565,7 +621,7 @@ async def get_order_logs(order_id: str, current_user: User = Depends(get_current
     """Get step-by-step operation logs for an order from SQL Server"""
     try:
         logs = sqlserver_db.get_order_logs(order_id)
-        return {"logs": logs, "total": len(logs)}
+        return ORJSONResponse({"logs": logs, "total": len(logs)})
     except Exception as e:
         raise HTTPException(status_code=500, detail="Sunucu hatası oluştu")
 
@@ -645,6 +701,8 @@ async def get_order_attachment(order_id: str, current_user: User = Depends(get_c
 # ============================================
 
 class ProcessOrderResponse(BaseModel):
+    model_config = _RESPONSE_MODEL_CONFIG
+
     status: str
     order_id: str
     order_code: str
@@ -682,6 +740,7 @@ async def _run_order_robot(order_id: str, order_info: dict):
                 "COMPLETED",
                 portal_order_number=result.portal_order_no
             )
+            _invalidate_stats_cache()
 
             # Add success log
             sqlserver_db.add_order_log(
@@ -693,7 +752,8 @@ async def _run_order_robot(order_id: str, order_info: dict):
 
             # Send completion notification email
             try:
-                _send_order_notification(
+                await run_in_threadpool(
+                    _send_order_notification,
                     order_code=order_code,
                     supplier_name=supplier_name,
                     customer_name=customer_name,
@@ -704,13 +764,14 @@ async def _run_order_robot(order_id: str, order_info: dict):
                     order_id=order_id,
                 )
             except Exception as notify_err:
-                print(f"[NOTIFICATION] Error sending notification: {notify_err}")
+                logger.error(f"[NOTIFICATION] Error sending notification: {notify_err}")
         else:
             sqlserver_db.update_order_status(
                 order_id,
                 "FAILED",
                 error_message=result.message
             )
+            _invalidate_stats_cache()
 
             # Add error log
             sqlserver_db.add_order_log(
@@ -722,7 +783,8 @@ async def _run_order_robot(order_id: str, order_info: dict):
 
             # Send error notification email
             try:
-                _send_order_notification(
+                await run_in_threadpool(
+                    _send_order_notification,
                     order_code=order_code,
                     supplier_name=supplier_name,
                     customer_name=customer_name,
@@ -732,7 +794,7 @@ async def _run_order_robot(order_id: str, order_info: dict):
                     order_id=order_id,
                 )
             except Exception as notify_err:
-                print(f"[NOTIFICATION] Error sending notification: {notify_err}")
+                logger.error(f"[NOTIFICATION] Error sending notification: {notify_err}")
 
     except Exception as e:
         # Update order as failed in SQL Server
@@ -741,6 +803,7 @@ async def _run_order_robot(order_id: str, order_info: dict):
             "FAILED",
             error_message=str(e)
         )
+        _invalidate_stats_cache()
 
         # Add error log
         sqlserver_db.add_order_log(
@@ -752,7 +815,8 @@ async def _run_order_robot(order_id: str, order_info: dict):
 
         # Send error notification email
         try:
-            _send_order_notification(
+            await run_in_threadpool(
+                _send_order_notification,
                 order_code=order_code,
                 supplier_name=supplier_name,
                 customer_name=customer_name,
@@ -762,7 +826,7 @@ async def _run_order_robot(order_id: str, order_info: dict):
                 order_id=order_id,
             )
         except Exception as notify_err:
-            print(f"[NOTIFICATION] Error sending notification: {notify_err}")
+            logger.error(f"[NOTIFICATION] Error sending notification: {notify_err}")
 
 
 def _send_order_notification(
@@ -778,9 +842,6 @@ def _send_order_notification(
 ):
     """Send order completion/error notification email to all configured recipients"""
     try:
-        from src.notifications.email_sender import EmailSender
-
-        sender = EmailSender()
         order_url = f"https://kolayrobot.com/dashboard/orders/{order_id}" if order_id else "https://kolayrobot.com/dashboard/orders"
 
         if success:
@@ -808,11 +869,11 @@ def _send_order_notification(
 
         recipients = settings.notification.recipients if hasattr(settings, 'notification') and hasattr(settings.notification, 'recipients') else []
         for recipient in recipients:
-            sender.send_email(recipient, subject, body)
+            email_sender.send_email(recipient, subject, body)
 
-        print(f"[NOTIFICATION] Order notification sent for {order_code}: {'success' if success else 'error'}")
+        logger.info(f"[NOTIFICATION] Order notification sent for {order_code}: {'success' if success else 'error'}")
     except Exception as e:
-        print(f"[NOTIFICATION] Failed to send order notification for {order_code}: {e}")
+        logger.error(f"[NOTIFICATION] Failed to send order notification for {order_code}: {e}")
 
 
 @app.post("/api/orders/{order_id}/process", response_model=ProcessOrderResponse)
@@ -829,8 +890,6 @@ async def process_order(
     3. Launch the appropriate robot to process the order in background
     4. Return immediately with processing status
     """
-    import asyncio
-
     try:
         # Find order from SQL Server
         order = sqlserver_db.get_order_by_id(order_id)
@@ -845,21 +904,6 @@ async def process_order(
                 detail=f"Order cannot be processed. Current status: {order['status']}"
             )
 
-        # Add audit log
-        user = sqlserver_db.get_user_by_username(current_user.username)
-        user_id = user["id"] if user else None
-        sqlserver_db.create_audit_log(
-            user_id=user_id,
-            action="order_process_trigger",
-            resource_type="order",
-            resource_id=order_id,
-            details=f"Siparis manuel olarak isleme alindi: {order['order_code']}",
-            ip_address="127.0.0.1"
-        )
-
-        # Update status to processing
-        sqlserver_db.update_order_status(order_id, "PROCESSING")
-
         # Parse order items from Excel attachment
         order_items = []
         parsed_order = None
@@ -871,11 +915,11 @@ async def process_order(
                 parsed_order = parser.parse_file(attachment_path)
                 if parsed_order and parsed_order.items:
                     order_items = [item.to_dict() for item in parsed_order.items]
-                    print(f"Parsed {len(order_items)} items from Excel: {attachment_path}")
+                    logger.info(f"Parsed {len(order_items)} items from Excel: {attachment_path}")
                 else:
-                    print(f"WARNING: No items parsed from Excel: {attachment_path}")
+                    logger.warning(f"No items parsed from Excel: {attachment_path}")
             except Exception as e:
-                print(f"ERROR: Failed to parse Excel attachment: {e}")
+                logger.error(f"Failed to parse Excel attachment: {e}")
 
         if not order_items:
             raise HTTPException(
@@ -883,6 +927,21 @@ async def process_order(
                 detail="No order items found. Check Excel attachment."
             )
 
+        # Claim the order atomically - the OrderWorker may be running it already
+        if not sqlserver_db.claim_order(order_id, ("PENDING", "FAILED")):
+            raise HTTPException(status_code=409, detail="Order is already being processed")
+        _invalidate_stats_cache()
+
+        # Add audit log
+        sqlserver_db.create_audit_log(
+            user_id=_get_user_id(current_user.username),
+            action="order_process_trigger",
+            resource_type="order",
+            resource_id=order_id,
+            details=f"Siparis manuel olarak isleme alindi: {order['order_code']}",
+            ip_address="127.0.0.1"
+        )
+
         # Extract customer info from parsed Excel if available
         excel_customer_code = order.get("customer_code", "")
         excel_customer_name = order.get("customer_name", "")
@@ -946,45 +1005,138 @@ async def list_emails(
             email['has_attachments'] = False  # TODO: track in DB
             email['attachment_count'] = 0  # TODO: track in DB
 
-        return {
+        return ORJSONResponse({
             "emails": emails,
             "total": total,
             "page": page,
             "page_size": page_size,
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail="Sunucu hatası oluştu")
 
 
-@app.post("/api/emails/fetch")
-async def fetch_emails_from_imap(
-    current_user: User = Depends(get_current_active_user),
-):
-    """Fetch all emails from IMAP and store in memory"""
+# Body preview: octets fetched from the text part (covers 2000 characters after
+# base64/quoted-printable decoding) and characters kept
+_EMAIL_PREVIEW_OCTETS = 8192
+_EMAIL_PREVIEW_CHARS = 2000
+
+
+def _decode_mime_header(value) -> str:
+    """Decode an RFC 2047 header value (bytes or str) to text"""
+    if not value:
+        return ""
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    result = []
+    for part, charset in decode_header(value):
+        if isinstance(part, bytes):
+            try:
+                result.append(part.decode(charset or "utf-8"))
+            except (LookupError, UnicodeDecodeError):
+                result.append(part.decode("utf-8", errors="replace"))
+        else:
+            result.append(part)
+    return "".join(result)
+
+
+def _bodystructure_params(params) -> Dict[str, bytes]:
+    """Flat (key, value, ...) BODYSTRUCTURE parameter list -> lowercase-key dict"""
+    if not params:
+        return {}
+    return {
+        params[i].decode("ascii", errors="replace").lower(): params[i + 1]
+        for i in range(0, len(params) - 1, 2)
+    }
+
+
+def _iter_leaf_parts(structure, number: str = ""):
+    """Yield (IMAP part number, BODYSTRUCTURE) for each non-multipart MIME part"""
+    if structure.is_multipart:
+        for index, part in enumerate(structure[0], start=1):
+            yield from _iter_leaf_parts(part, f"{number}.{index}" if number else str(index))
+    else:
+        yield number or "1", structure
+
+
+def _part_disposition(part) -> Tuple[str, Dict[str, bytes]]:
+    """Content-Disposition type and params of a single-part BODYSTRUCTURE"""
+    # Extension data follows the type-specific fields (RFC 3501 body-type-1part)
+    main_type = part[0].lower()
+    if main_type == b"text":
+        index = 9
+    elif main_type == b"message" and part[1].lower() == b"rfc822":
+        index = 11
+    else:
+        index = 8
+    disposition = part[index] if len(part) > index else None
+    if not isinstance(disposition, tuple) or not disposition:
+        return "", {}
+    return disposition[0].decode("ascii", errors="replace").lower(), _bodystructure_params(disposition[1])
+
+
+def _part_filename(part, disposition_params: Dict[str, bytes]) -> str:
+    """Attachment filename from Content-Disposition, falling back to Content-Type name"""
+    raw = disposition_params.get("filename")
+    if raw is None and "filename*" in disposition_params:
+        # RFC 2231: charset'language'percent-encoded
+        charset, _, encoded = decode_rfc2231(disposition_params["filename*"].decode("ascii", errors="replace"))
+        return unquote(encoded, encoding=charset or "utf-8", errors="replace").strip()
+    if raw is None:
+        raw = _bodystructure_params(part[2]).get("name")
+    return _decode_mime_header(raw).replace("\r\n", "").strip()
+
+
+def _decode_preview(raw: bytes, part) -> str:
+    """Decode a partial text part fetch using the part's transfer encoding and charset"""
+    encoding = (part[5] or b"").lower()
+    if encoding == b"base64":
+        raw = b"".join(raw.split())
+        raw = base64.b64decode(raw[:len(raw) - len(raw) % 4])
+    elif encoding == b"quoted-printable":
+        raw = quopri.decodestring(raw)
+    charset = _bodystructure_params(part[2]).get("charset", b"utf-8").decode("ascii", errors="replace")
+    try:
+        text = raw.decode(charset, errors="replace")
+    except LookupError:
+        text = raw.decode("utf-8", errors="replace")
+    if len(text) > _EMAIL_PREVIEW_CHARS:
+        text = text[:_EMAIL_PREVIEW_CHARS] + "..."
+    return text
+
+
+def _envelope_sender(envelope) -> str:
+    """First From address of an IMAP ENVELOPE as mailbox@host"""
+    if not envelope.from_:
+        return ""
+    sender = envelope.from_[0]
+    from_addr = _decode_mime_header(sender.mailbox)
+    if sender.host:
+        from_addr += "@" + _decode_mime_header(sender.host)
+    return from_addr
+
+
+def _is_order_sender(from_addr: str) -> bool:
+    """Order emails come from Caspar"""
+    return "caspar" in from_addr.lower()
+
+
+# One IMAP sync at a time - concurrent syncs would race on _imap_state
+_imap_fetch_lock = threading.Lock()
+
+
+def _fetch_emails_sync() -> dict:
+    """Fetch new emails from IMAP (since the last sync) and store in memory (blocking)"""
+    with _imap_fetch_lock:
+        return _fetch_new_emails()
+
+
+def _fetch_new_emails() -> dict:
+    """IMAP sync body - caller holds _imap_fetch_lock"""
     import ssl
-    import email as email_module
-    from email.header import decode_header
     from imapclient import IMAPClient
-    import uuid
 
     global _emails_db
 
-    def decode_header_value(value):
-        if value is None:
-            return ""
-        decoded_parts = decode_header(value)
-        result = []
-        for part, charset in decoded_parts:
-            if isinstance(part, bytes):
-                charset = charset or "utf-8"
-                try:
-                    result.append(part.decode(charset))
-                except:
-                    result.append(part.decode("utf-8", errors="replace"))
-            else:
-                result.append(part)
-        return "".join(result)
-
     try:
         # Connect to IMAP
         ssl_context = ssl.create_default_context()
@@ -996,93 +1148,150 @@ async def fetch_emails_from_imap(
         )
 
         client.login(settings.email.user, settings.email.password)
-        client.select_folder("INBOX")
-
-        # Get all messages
-        all_messages = client.search(["ALL"])
+        folder_info = client.select_folder("INBOX")
+
+        # Only fetch UIDs above the last seen one while UIDVALIDITY is unchanged;
+        # a new UIDVALIDITY invalidates every stored UID, so resync from scratch
+        uidvalidity = folder_info.get(b"UIDVALIDITY")
+        if uidvalidity != _imap_state["uidvalidity"]:
+            _emails_db = []
+            _imap_state["uidvalidity"] = uidvalidity
+            _imap_state["max_uid"] = 0
+
+        last_uid = _imap_state["max_uid"]
+        if last_uid:
+            # "n:*" always matches the highest UID, even when it is below n
+            all_messages = [uid for uid in client.search(["UID", f"{last_uid + 1}:*"]) if uid > last_uid]
+        else:
+            all_messages = client.search(["ALL"])
 
+        # Ascending so a failed batch leaves max_uid below every UID not yet fetched
+        all_messages = sorted(all_messages)
         emails_data = []
 
-        for msg_id in all_messages:
-            try:
-                response = client.fetch([msg_id], ["RFC822", "INTERNALDATE", "FLAGS"])
-                raw_email = response[msg_id][b"RFC822"]
-                internal_date = response[msg_id][b"INTERNALDATE"]
-                flags = response[msg_id][b"FLAGS"]
-
-                msg = email_module.message_from_bytes(raw_email)
-
-                subject = decode_header_value(msg.get("Subject", ""))
-                from_addr = decode_header_value(msg.get("From", ""))
-
-                # Extract email address
-                if "<" in from_addr and ">" in from_addr:
-                    from_addr = from_addr[from_addr.index("<")+1:from_addr.index(">")]
-
-                # Check for attachments and extract body text
-                has_attachments = False
-                attachment_names = []
-                body_text = ""
-
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        content_type = part.get_content_type()
-                        content_disposition = str(part.get("Content-Disposition", ""))
-
-                        # Extract attachments
-                        if "attachment" in content_disposition:
-                            filename = part.get_filename()
-                            if filename:
-                                attachment_names.append(decode_header_value(filename).replace("\r\n", "").strip())
-                                has_attachments = True
-                        # Extract body text
-                        elif content_type == "text/plain" and not body_text:
-                            try:
-                                charset = part.get_content_charset() or "utf-8"
-                                body_text = part.get_payload(decode=True).decode(charset, errors="replace")
-                                # Limit body text length
-                                if len(body_text) > 2000:
-                                    body_text = body_text[:2000] + "..."
-                            except:
-                                pass
-                else:
-                    # Single part message
-                    try:
-                        charset = msg.get_content_charset() or "utf-8"
-                        body_text = msg.get_payload(decode=True).decode(charset, errors="replace")
-                        if len(body_text) > 2000:
-                            body_text = body_text[:2000] + "..."
-                    except:
-                        pass
-
-                is_order = "caspar" in from_addr.lower() and has_attachments
-
-                email_data = {
-                    "id": str(uuid.uuid4()),
-                    "imap_uid": msg_id,
-                    "subject": subject,
-                    "from_address": from_addr,
-                    "received_at": internal_date.isoformat(),
-                    "has_attachments": has_attachments,
-                    "attachment_count": len(attachment_names),
-                    "attachments": attachment_names,
-                    "body_text": body_text,
-                    "is_read": b"\\Seen" in flags,
-                    "status": "processed" if b"\\Seen" in flags else "pending",
-                    "is_order_email": is_order
-                }
-
-                emails_data.append(email_data)
+        # Highest UID up to which every message was fully processed - the next
+        # sync resumes after it, so a failed message is examined again
+        synced_uid = last_uid
+        stalled = False
 
+        # One FETCH round-trip per batch instead of one per message. Headers and
+        # MIME structure come from ENVELOPE/BODYSTRUCTURE - no full message bodies
+        batch_size = settings.email.fetch_batch_size
+        for start in range(0, len(all_messages), batch_size):
+            batch = all_messages[start:start + batch_size]
+            try:
+                response = client.fetch(batch, ["ENVELOPE", "INTERNALDATE", "FLAGS"])
             except Exception as e:
-                continue
+                # Stop here - later batches would advance max_uid past this one
+                logger.error(f"Error fetching batch of {len(batch)} emails, stopping sync: {e}")
+                break
+
+            # Only order candidates (Caspar senders) need MIME structure and a
+            # body preview - other mail is recorded from the envelope alone
+            senders = {msg_id: _envelope_sender(data[b"ENVELOPE"]) for msg_id, data in response.items()}
+            candidates = [msg_id for msg_id, from_addr in senders.items() if _is_order_sender(from_addr)]
+            structures = {}
+            if candidates:
+                try:
+                    structures = client.fetch(candidates, ["BODYSTRUCTURE"])
+                except Exception as e:
+                    # Without structure order emails can't be classified - stop like a failed batch
+                    logger.error(f"Error fetching structure of {len(candidates)} emails, stopping sync: {e}")
+                    break
+
+            # part number -> {msg_id: (email_data, text part)} for the preview fetch
+            previews: Dict[str, Dict[int, tuple]] = {}
+
+            for msg_id in batch:
+                try:
+                    if msg_id not in response:
+                        # Expunged since the SEARCH - nothing left to process
+                        if not stalled:
+                            synced_uid = msg_id
+                        continue
+
+                    envelope = response[msg_id][b"ENVELOPE"]
+                    internal_date = response[msg_id][b"INTERNALDATE"]
+                    flags = response[msg_id][b"FLAGS"]
+                    structure = structures.get(msg_id, {}).get(b"BODYSTRUCTURE")
+
+                    subject = _decode_mime_header(envelope.subject)
+                    from_addr = senders[msg_id]
+
+                    # Attachments and the body preview part from the MIME structure
+                    attachment_names = []
+                    preview_part = None
+
+                    if structure is not None and structure.is_multipart:
+                        for number, part in _iter_leaf_parts(structure):
+                            disposition, params = _part_disposition(part)
+                            if disposition == "attachment":
+                                filename = _part_filename(part, params)
+                                if filename:
+                                    attachment_names.append(filename)
+                            elif preview_part is None and part[0].lower() == b"text" and part[1].lower() == b"plain":
+                                preview_part = (number, part)
+                    elif structure is not None:
+                        # Single part message
+                        preview_part = ("1", structure)
+
+                    has_attachments = bool(attachment_names)
+                    is_order = _is_order_sender(from_addr) and has_attachments
+
+                    email_data = {
+                        "id": str(uuid.uuid4()),
+                        "imap_uid": msg_id,
+                        "subject": subject,
+                        "from_address": from_addr,
+                        "received_at": internal_date.isoformat(),
+                        "has_attachments": has_attachments,
+                        "attachment_count": len(attachment_names),
+                        "attachments": attachment_names,
+                        "body_text": "",
+                        "is_read": b"\\Seen" in flags,
+                        "status": "processed" if b"\\Seen" in flags else "pending",
+                        "is_order_email": is_order
+                    }
+
+                    emails_data.append(email_data)
+
+                    if preview_part:
+                        number, part = preview_part
+                        previews.setdefault(number, {})[msg_id] = (email_data, part)
+
+                    if not stalled:
+                        synced_uid = msg_id
+
+                except Exception as e:
+                    logger.error(f"Error processing email UID {msg_id}: {e}")
+                    stalled = True
+
+            # Body previews: one partial FETCH per part number. BODY.PEEK leaves
+            # \Seen untouched, unlike the full RFC822 fetch
+            for number, pending in previews.items():
+                section = f"BODY.PEEK[{number}]<0.{_EMAIL_PREVIEW_OCTETS}>"
+                try:
+                    bodies = client.fetch(list(pending), [section])
+                except Exception as e:
+                    logger.error(f"Error fetching body previews for {len(pending)} emails: {e}")
+                    continue
+
+                for msg_id, (email_data, part) in pending.items():
+                    try:
+                        # Servers answer with BODY[n]<0> - match the section loosely
+                        raw = next(v for k, v in bodies[msg_id].items() if k.startswith(b"BODY["))
+                        email_data["body_text"] = _decode_preview(raw, part)
+                    except Exception:
+                        continue
 
         client.logout()
 
-        # Update global storage
-        _emails_db = emails_data
+        # Append new messages (de-duplicated by UID) and advance the sync point
+        known_uids = {e["imap_uid"] for e in _emails_db}
+        _emails_db.extend(e for e in emails_data if e["imap_uid"] not in known_uids)
+        _imap_state["max_uid"] = max(_imap_state["max_uid"], synced_uid)
 
-        order_count = len([e for e in emails_data if e.get("is_order_email")])
+        order_count = sum(1 for e in emails_data if e.get("is_order_email"))
 
         return {
             "status": "success",
@@ -1095,6 +1304,50 @@ async def fetch_emails_from_imap(
         raise HTTPException(status_code=500, detail="E-posta sunucu hatası oluştu")
 
 
+@app.post("/api/emails/fetch")
+async def fetch_emails_from_imap(
+    current_user: User = Depends(get_current_active_user),
+):
+    """Fetch new emails from IMAP (since the last sync) and store in memory"""
+    # Blocking IMAP I/O runs in the threadpool so other requests keep flowing
+    return await run_in_threadpool(_fetch_emails_sync)
+
+
+# Log tailing: lines kept per file and backward read size
+_LOG_TAIL_LINES = 500
+_LOG_TAIL_CHUNK_SIZE = 64 * 1024
+
+# RE2 (linear-time automaton, no backtracking) for log scanning when installed
+try:
+    import re2 as _log_re
+except ImportError:
+    _log_re = re
+
+# Log line parsing: timestamps like "2026-01-27 10:28:29" and level keywords
+# checked in priority order ("WARN" also covers "WARNING")
+_LOG_TIMESTAMP_RE = _log_re.compile(r"(\d{4}-\d{2}-\d{2}[T\s]\d{2}:\d{2}:\d{2})")
+_LOG_LEVEL_TABLE = (("ERROR", "ERROR"), ("WARN", "WARNING"), ("DEBUG", "DEBUG"))
+
+
+def _tail_lines(path, n: int = _LOG_TAIL_LINES) -> List[str]:
+    """Last n lines of a file, reading backwards from EOF in fixed-size chunks"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        buf = b""
+        # n + 1 newlines guarantee n complete lines (the first piece may be partial)
+        while end > 0 and buf.count(b"\n") <= n:
+            step = min(_LOG_TAIL_CHUNK_SIZE, end)
+            end -= step
+            f.seek(end)
+            buf = f.read(step) + buf
+
+    lines = buf.splitlines()
+    if end > 0:
+        lines = lines[1:]
+    return [line.decode("utf-8", errors="replace") for line in lines[-n:]]
+
+
 @app.get("/api/logs")
 async def get_logs(
     page: int = Query(1, ge=1),
@@ -1104,10 +1357,14 @@ async def get_logs(
     current_user: User = Depends(get_current_active_user),
 ):
     """Get system logs from PM2 log files"""
-    import re
     from pathlib import Path
 
     logs = []
+    line_id = 0
+    level_counts = {"ERROR": 0, "WARNING": 0, "INFO": 0, "DEBUG": 0}
+    level_upper = level.upper() if level else None
+    # Lines without a timestamp sort as "now"
+    fallback_timestamp = datetime.now(timezone.utc).isoformat()
     log_files = [
         ("/home/ubuntu/.pm2/logs/dorumake-api-out.log", "api"),
         ("/home/ubuntu/.pm2/logs/dorumake-api-error.log", "api"),
@@ -1119,32 +1376,37 @@ async def get_logs(
         try:
             path = Path(log_file)
             if path.exists():
-                with open(path, "r", encoding="utf-8", errors="replace") as f:
-                    lines = f.readlines()[-500:]  # Last 500 lines
+                lines = _tail_lines(path)
 
                 for line in lines:
                     line = line.strip()
                     if not line:
                         continue
 
-                    # Parse log level
+                    # Parse log level (one case fold per line)
                     log_level = "INFO"
-                    if "ERROR" in line.upper():
-                        log_level = "ERROR"
-                    elif "WARNING" in line.upper() or "WARN" in line.upper():
-                        log_level = "WARNING"
-                    elif "DEBUG" in line.upper():
-                        log_level = "DEBUG"
+                    upper_line = line.upper()
+                    for needle, needle_level in _LOG_LEVEL_TABLE:
+                        if needle in upper_line:
+                            log_level = needle_level
+                            break
 
                     # Extract timestamp if available
-                    timestamp = datetime.utcnow().isoformat()
-                    # Try to parse timestamps like "2026-01-27 10:28:29"
-                    ts_match = re.search(r"(\d{4}-\d{2}-\d{2}[T\s]\d{2}:\d{2}:\d{2})", line)
+                    timestamp = fallback_timestamp
+                    ts_match = _LOG_TIMESTAMP_RE.search(line)
                     if ts_match:
                         timestamp = ts_match.group(1).replace(" ", "T")
 
+                    # Stats cover every line; the page only the filtered ones
+                    line_id += 1
+                    level_counts[log_level] += 1
+                    if level_upper and log_level != level_upper:
+                        continue
+                    if source and source_name != source:
+                        continue
+
                     logs.append({
-                        "id": len(logs) + 1,
+                        "id": line_id,
                         "timestamp": timestamp,
                         "level": log_level,
                         "source": source_name,
@@ -1153,38 +1415,26 @@ async def get_logs(
         except Exception as e:
             continue
 
-    # Calculate stats before filtering
     stats = {
-        "error_count": sum(1 for l in logs if l["level"].upper() == "ERROR"),
-        "warning_count": sum(1 for l in logs if l["level"].upper() == "WARNING"),
-        "info_count": sum(1 for l in logs if l["level"].upper() == "INFO"),
-        "debug_count": sum(1 for l in logs if l["level"].upper() == "DEBUG"),
+        "error_count": level_counts["ERROR"],
+        "warning_count": level_counts["WARNING"],
+        "info_count": level_counts["INFO"],
+        "debug_count": level_counts["DEBUG"],
     }
 
-    # Filter by level if specified
-    if level:
-        logs = [l for l in logs if l["level"].upper() == level.upper()]
-
-    # Filter by source if specified
-    if source:
-        logs = [l for l in logs if l["source"] == source]
-
-    # Sort by timestamp descending
-    logs = sorted(logs, key=lambda x: x["timestamp"], reverse=True)
-
-    # Paginate
+    # Newest first: only the top start+page_size entries need ordering
     total = len(logs)
     start = (page - 1) * page_size
     end = start + page_size
-    paginated_logs = logs[start:end]
+    paginated_logs = heapq.nlargest(end, logs, key=itemgetter("timestamp"))[start:]
 
-    return {
+    return ORJSONResponse({
         "logs": paginated_logs,
         "total": total,
         "page": page,
         "page_size": page_size,
         "stats": stats,
-    }
+    })
 
 
 @app.get("/api/audit-logs")
@@ -1203,163 +1453,133 @@ async def get_audit_logs(
             page=page,
             page_size=page_size
         )
-        return {
+        return ORJSONResponse({
             "logs": logs,
             "total": total,
             "page": page,
             "page_size": page_size,
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail="Sunucu hatası oluştu")
 
 
+# Manual order ids: hex nanosecond clock + per-process counter (unique within the same second)
+_manual_order_counter = count()
+
+
 @app.post("/api/orders/manual")
 async def create_manual_order(request: ManualOrderRequest, current_user: User = Depends(get_current_active_user)):
     """Create and process order manually"""
     # TODO: Implement manual order creation
     return {
         "status": "created",
-        "order_id": "manual-" + datetime.now().strftime("%Y%m%d%H%M%S"),
+        "order_id": f"manual-{time.time_ns():x}{next(_manual_order_counter) & 0xFFFF:04x}",
     }
 
 
+# Supplier list only depends on settings - serialize once at import
+_SUPPLIERS_JSON = orjson.dumps({
+    "suppliers": [
+        {
+            "code": "MUTLU",
+            "name": "Mutlu Akü",
+            "portal_url": settings.mutlu_aku.portal_url,
+            "active": True,
+        },
+        {
+            "code": "MANN",
+            "name": "Mann & Hummel",
+            "portal_url": settings.mann_hummel.portal_url,
+            "active": True,
+        },
+    ]
+})
+
+
 @app.get("/api/suppliers")
 async def list_suppliers(current_user: User = Depends(get_current_active_user)):
     """List configured suppliers"""
-    return {
-        "suppliers": [
-            {
-                "code": "MUTLU",
-                "name": "Mutlu Akü",
-                "portal_url": settings.mutlu_aku.portal_url,
-                "active": True,
-            },
-            {
-                "code": "MANN",
-                "name": "Mann & Hummel",
-                "portal_url": settings.mann_hummel.portal_url,
-                "active": True,
-            },
-        ]
-    }
+    return Response(content=_SUPPLIERS_JSON, media_type="application/json")
+
+
+# Configured scheduled jobs, built once: requests only stamp the run times.
+# Interval None = daily at midnight
+_SCHEDULER_JOBS = (
+    ({
+        "id": "email_poll",
+        "name": "Email Polling",
+        "trigger": "interval[0:01:00]",
+        "description": "IMAP'ten yeni sipariş emaillerini kontrol eder",
+        "schedule": "Her 60 saniyede bir",
+        "cron": "*/1 * * * *",
+        "status": "active",
+    }, timedelta(seconds=60)),
+    ({
+        "id": "order_processor",
+        "name": "Order Processor",
+        "trigger": "interval[0:05:00]",
+        "description": "Bekleyen siparişleri işler",
+        "schedule": "Her 5 dakikada bir",
+        "cron": "*/5 * * * *",
+        "status": "active",
+    }, timedelta(minutes=5)),
+    ({
+        "id": "health_check",
+        "name": "Health Check",
+        "trigger": "interval[0:10:00]",
+        "description": "Sistem sağlık kontrolü yapar",
+        "schedule": "Her 10 dakikada bir",
+        "cron": "*/10 * * * *",
+        "status": "active",
+    }, timedelta(minutes=10)),
+    ({
+        "id": "log_cleanup",
+        "name": "Log Cleanup",
+        "trigger": "cron[0 0 * * *]",
+        "description": "Eski log dosyalarını temizler",
+        "schedule": "Her gün gece yarısı",
+        "cron": "0 0 * * *",
+        "status": "active",
+    }, None),
+)
+
+
+# Serialized jobs payload, rebuilt at most once per second (like the health payload)
+_scheduler_jobs_payload = (0, b"")
 
 
 @app.get("/api/scheduler/jobs")
 async def get_scheduler_jobs(current_user: User = Depends(get_current_active_user)):
     """Get scheduled jobs"""
-    # Return configured scheduled jobs
-    now = datetime.now(timezone.utc)
-    jobs = [
-        {
-            "id": "email_poll",
-            "name": "Email Polling",
-            "trigger": "interval[0:01:00]",
-            "description": "IMAP'ten yeni sipariş emaillerini kontrol eder",
-            "schedule": "Her 60 saniyede bir",
-            "cron": "*/1 * * * *",
-            "status": "active",
-            "last_run": now.isoformat(),
-            "next_run": (now + timedelta(seconds=60)).isoformat(),
-        },
-        {
-            "id": "order_processor",
-            "name": "Order Processor",
-            "trigger": "interval[0:05:00]",
-            "description": "Bekleyen siparişleri işler",
-            "schedule": "Her 5 dakikada bir",
-            "cron": "*/5 * * * *",
-            "status": "active",
-            "last_run": now.isoformat(),
-            "next_run": (now + timedelta(minutes=5)).isoformat(),
-        },
-        {
-            "id": "health_check",
-            "name": "Health Check",
-            "trigger": "interval[0:10:00]",
-            "description": "Sistem sağlık kontrolü yapar",
-            "schedule": "Her 10 dakikada bir",
-            "cron": "*/10 * * * *",
-            "status": "active",
-            "last_run": now.isoformat(),
-            "next_run": (now + timedelta(minutes=10)).isoformat(),
-        },
-        {
-            "id": "log_cleanup",
-            "name": "Log Cleanup",
-            "trigger": "cron[0 0 * * *]",
-            "description": "Eski log dosyalarını temizler",
-            "schedule": "Her gün gece yarısı",
-            "cron": "0 0 * * *",
-            "status": "active",
-            "last_run": now.replace(hour=0, minute=0, second=0, microsecond=0).isoformat(),
-            "next_run": (now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).isoformat(),
-        },
-    ]
-    return {"jobs": jobs}
+    global _scheduler_jobs_payload
+    second = int(time.time())
+    if _scheduler_jobs_payload[0] != second:
+        now = datetime.fromtimestamp(second, tz=timezone.utc)
+        now_iso = now.isoformat()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        midnight_iso = midnight.isoformat()
+        next_midnight_iso = (midnight + timedelta(days=1)).isoformat()
+
+        jobs = []
+        for job, interval in _SCHEDULER_JOBS:
+            if interval is None:
+                jobs.append({**job, "last_run": midnight_iso, "next_run": next_midnight_iso})
+            else:
+                jobs.append({**job, "last_run": now_iso, "next_run": (now + interval).isoformat()})
+        _scheduler_jobs_payload = (second, orjson.dumps({"jobs": jobs}))
+    return Response(content=_scheduler_jobs_payload[1], media_type="application/json")
 
 
 # ============================================
 # USER MANAGEMENT ENDPOINTS
 # ============================================
 
-# In-memory users storage (will be replaced with database later)
-# Pre-computed password hashes (salt: dorumake-salt-2025)
-# admin123 -> eefe9baf8455e2d688e375da8aa9103ee8785326e28fcbd7e9fbde4aa6d3e073
-_users_db: List[dict] = [
-    {
-        "id": 1,
-        "username": "admin",
-        "email": "admin@dorufinansal.com",
-        "full_name": "Sistem Yöneticisi",
-        "role": "admin",
-        "is_active": True,
-        "receive_notifications": True,
-        "created_at": "2025-01-01T00:00:00",
-        "hashed_password": "eefe9baf8455e2d688e375da8aa9103ee8785326e28fcbd7e9fbde4aa6d3e073",
-    },
-    {
-        "id": 2,
-        "username": "arif.ozelci",
-        "email": "arif.ozelci@dorufinansal.com",
-        "full_name": "Arif Ozelci",
-        "role": "admin",
-        "is_active": True,
-        "receive_notifications": True,
-        "created_at": "2026-01-27T07:00:00",
-        "hashed_password": "eefe9baf8455e2d688e375da8aa9103ee8785326e28fcbd7e9fbde4aa6d3e073",
-    },
-    {
-        "id": 3,
-        "username": "asim.koc",
-        "email": "asim.koc@dorufinansal.com",
-        "full_name": "Asim Koc",
-        "role": "admin",
-        "is_active": True,
-        "receive_notifications": True,
-        "created_at": "2026-01-27T07:00:00",
-        "hashed_password": "eefe9baf8455e2d688e375da8aa9103ee8785326e28fcbd7e9fbde4aa6d3e073",
-    },
-    {
-        "id": 4,
-        "username": "dilsad.kaptan",
-        "email": "dilsad.kaptan@dorufinansal.com",
-        "full_name": "Dilsad Kaptan",
-        "role": "admin",
-        "is_active": True,
-        "receive_notifications": True,
-        "created_at": "2026-01-27T07:00:00",
-        "hashed_password": "eefe9baf8455e2d688e375da8aa9103ee8785326e28fcbd7e9fbde4aa6d3e073",
-    },
-]
-_next_user_id = 5
-
-
-@app.get("/api/users", response_model=List[UserResponse])
+@app.get("/api/users", responses={200: {"model": List[UserResponse]}})
 async def list_users(current_user: User = Depends(get_current_active_user)):
     """List all users from SQL Server"""
     try:
         users = sqlserver_db.get_users()
-        return users
+        return ORJSONResponse(users)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Sunucu hatası oluştu")
 
@@ -1371,30 +1591,28 @@ async def create_user_with_email(
 ):
     """Create a new user and send email notification"""
     try:
-        # Check if username already exists
-        existing_user = sqlserver_db.get_user_by_username(request.username)
-        if existing_user:
-            raise HTTPException(status_code=400, detail="Username already exists")
-
-        existing_email = sqlserver_db.get_user_by_email(request.email)
-        if existing_email:
-            raise HTTPException(status_code=400, detail="Email already exists")
-
         # Generate password if not provided
         password = request.password or generate_random_password()
 
-        # Create user in SQL Server
+        # Create user in SQL Server (uniqueness is checked atomically by the insert)
         new_user = sqlserver_db.create_user(
             username=request.username,
             email=request.email,
-            hashed_password=get_password_hash(password),
+            hashed_password=await get_password_hash_async(password),
             full_name=request.full_name or "",
             role=request.role
         )
+        if new_user is None:
+            # Only the conflict path pays for the lookup of which field clashed
+            conflict = sqlserver_db.find_user_conflict(request.username, request.email)
+            if conflict == "email":
+                raise HTTPException(status_code=400, detail="Email already exists")
+            raise HTTPException(status_code=400, detail="Username already exists")
+        _invalidate_recipients_cache()
 
-        # Send welcome email
-        email_sender = EmailSender()
-        email_sent = email_sender.send_email(
+        # Send welcome email (SMTP I/O off the event loop)
+        email_sent = await run_in_threadpool(
+            email_sender.send_email,
             to=request.email,
             subject="KolayRobot - Hoş Geldiniz",
             body=f"""Merhaba {request.full_name or request.username},
@@ -1414,7 +1632,7 @@ KolayRobot Ekibi"""
 
         if not email_sent:
             # Log warning but don't fail the request
-            print(f"Warning: Could not send welcome email to {request.email}")
+            logger.warning(f"Could not send welcome email to {request.email}")
 
         return new_user
     except HTTPException:
@@ -1445,6 +1663,8 @@ async def update_user(
             is_active=request.is_active,
             receive_notifications=request.receive_notifications
         )
+        invalidate_user_cache(existing_user["username"])
+        _invalidate_recipients_cache()
 
         return updated_user
     except HTTPException:
@@ -1460,19 +1680,20 @@ async def delete_user(
 ):
     """Delete a user from SQL Server"""
     try:
-        # Check if user exists
+        # One round trip on the common path; look up only to pick the error
+        deleted_username = sqlserver_db.delete_user(user_id, protected_username="admin")
+        if deleted_username:
+            invalidate_user_cache(deleted_username)
+            _user_id_by_username.pop(deleted_username, None)
+            _invalidate_recipients_cache()
+            return {"status": "deleted", "user_id": user_id}
+
         existing_user = sqlserver_db.get_user_by_id(user_id)
         if not existing_user:
             raise HTTPException(status_code=404, detail="User not found")
-
         if existing_user["username"] == "admin":
             raise HTTPException(status_code=400, detail="Cannot delete admin user")
-
-        deleted = sqlserver_db.delete_user(user_id)
-        if deleted:
-            return {"status": "deleted", "user_id": user_id}
-        else:
-            raise HTTPException(status_code=500, detail="Failed to delete user")
+        raise HTTPException(status_code=500, detail="Failed to delete user")
     except HTTPException:
         raise
     except Exception as e:
@@ -1494,11 +1715,12 @@ async def reset_user_password(
         new_password = generate_random_password()
 
         # Update password in database
-        sqlserver_db.update_user(user_id, hashed_password=get_password_hash(new_password))
+        sqlserver_db.update_user(user_id, hashed_password=await get_password_hash_async(new_password))
+        invalidate_user_cache(user["username"])
 
-        # Send password reset email
-        email_sender = EmailSender()
-        email_sent = email_sender.send_email(
+        # Send password reset email (SMTP I/O off the event loop)
+        email_sent = await run_in_threadpool(
+            email_sender.send_email,
             to=user["email"],
             subject="KolayRobot - Şifre Sıfırlama",
             body=f"""Merhaba {user.get('full_name', user['username'])},
@@ -1530,7 +1752,7 @@ KolayRobot Ekibi"""
 # EMAIL TEMPLATE ENDPOINTS
 # ============================================
 
-# In-memory templates storage
+# Built-in email templates (edits are saved to SQL Server and applied at startup)
 _templates_db: List[dict] = [
     {
         "id": 1,
@@ -1548,7 +1770,6 @@ Lütfen ilk girişinizde şifrenizi değiştirin.
 İyi çalışmalar,
 KolayRobot Ekibi""",
         "description": "Yeni kullanıcı oluşturulduğunda gönderilir",
-        "variables": ["full_name", "username", "password"],
         "is_active": True,
         "updated_at": "2025-01-01T00:00:00",
     },
@@ -1567,7 +1788,6 @@ Lütfen giriş yaptıktan sonra şifrenizi değiştirin.
 İyi çalışmalar,
 KolayRobot Ekibi""",
         "description": "Şifre sıfırlandığında gönderilir",
-        "variables": ["full_name", "password"],
         "is_active": True,
         "updated_at": "2025-01-01T00:00:00",
     },
@@ -1585,7 +1805,6 @@ Lütfen kontrol edin.
 
 KolayRobot Sistemi""",
         "description": "Sipariş hatası oluştuğunda gönderilir",
-        "variables": ["order_code", "supplier", "error_message"],
         "is_active": True,
         "updated_at": "2025-01-01T00:00:00",
     },
@@ -1601,7 +1820,6 @@ Toplam Kalem: {item_count}
 
 KolayRobot Sistemi""",
         "description": "Sipariş başarıyla tamamlandığında gönderilir",
-        "variables": ["order_code", "supplier", "item_count"],
         "is_active": True,
         "updated_at": "2025-01-01T00:00:00",
     },
@@ -1617,17 +1835,80 @@ Zaman: {timestamp}
 
 KolayRobot Sistemi""",
         "description": "Sistem uyarıları için gönderilir",
-        "variables": ["level", "message", "timestamp"],
         "is_active": True,
         "updated_at": "2025-01-01T00:00:00",
     },
 ]
 
+# {placeholder} tokens in template subject/body
+_TEMPLATE_VAR_RE = re.compile(r"\{([a-zA-Z_][a-zA-Z0-9_]*)\}")
+
+
+# Render plans: name -> (subject parts, body parts). Parts alternate literal text
+# and placeholder names, so sending is a single join instead of a scan per param
+_template_plans: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {}
+
+# Encoded /api/templates body, rebuilt on the first list after a template change
+_templates_json_cache = {"body": None}
+
+
+def _compile_template(template: dict) -> None:
+    """Build the render plan and variables list for a template (on load/update)"""
+    subject_parts = tuple(_TEMPLATE_VAR_RE.split(template["subject"]))
+    body_parts = tuple(_TEMPLATE_VAR_RE.split(template["body"]))
+    _template_plans[template["name"]] = (subject_parts, body_parts)
+    # Placeholder names in order of first appearance
+    template["variables"] = list(dict.fromkeys(subject_parts[1::2] + body_parts[1::2]))
+    _templates_json_cache["body"] = None
 
-@app.get("/api/templates", response_model=List[TemplateResponse])
+
+def _render_parts(parts: Tuple[str, ...], values: Dict[str, str]) -> str:
+    """Fill a compiled plan - placeholders without a value are left as-is"""
+    out = list(parts)
+    for i in range(1, len(out), 2):
+        name = out[i]
+        out[i] = values[name] if name in values else "{" + name + "}"
+    return "".join(out)
+
+
+def render_template(template: dict, params: dict) -> Tuple[str, str]:
+    """Render a template's subject and body with the given parameters"""
+    subject_parts, body_parts = _template_plans[template["name"]]
+    # str() each used param once, even if it appears in both subject and body
+    values = {name: str(params[name]) for name in template["variables"] if name in params}
+    return _render_parts(subject_parts, values), _render_parts(body_parts, values)
+
+
+for _template in _templates_db:
+    _compile_template(_template)
+
+# Name -> template (same dict objects as the list, so in-place edits show in both)
+_templates_by_name: Dict[str, dict] = {t["name"]: t for t in _templates_db}
+
+
+@app.get("/api/templates", responses={200: {"model": List[TemplateResponse]}})
 async def list_templates(current_user: User = Depends(get_current_active_user)):
     """List all email templates"""
-    return _templates_db
+    body = _templates_json_cache["body"]
+    if body is None:
+        body = _templates_json_cache["body"] = orjson.dumps(_templates_db)
+    return Response(content=body, media_type="application/json")
+
+
+def _load_saved_templates():
+    """Overlay templates saved in SQL Server onto _templates_db (called at startup)"""
+    sqlserver_db.ensure_email_templates_table()
+    for row in sqlserver_db.get_email_templates():
+        template = _templates_by_name.get(row["name"])
+        if template:
+            template.update(
+                subject=row["subject"],
+                body=row["body"],
+                description=row["description"] or "",
+                is_active=bool(row["is_active"]),
+                updated_at=row["updated_at"],
+            )
+            _compile_template(template)
 
 
 @app.put("/api/templates/{template_name}", response_model=TemplateResponse)
@@ -1636,108 +1917,290 @@ async def update_template(
     request: UpdateTemplateRequest,
     current_user: User = Depends(get_current_active_user)
 ):
-    """Update an email template"""
-    for template in _templates_db:
-        if template["name"] == template_name:
-            if request.subject is not None:
-                template["subject"] = request.subject
-            if request.body is not None:
-                template["body"] = request.body
-            if request.description is not None:
-                template["description"] = request.description
-            if request.is_active is not None:
-                template["is_active"] = request.is_active
-            template["updated_at"] = datetime.utcnow().isoformat()
-            return template
-
-    raise HTTPException(status_code=404, detail="Template not found")
+    """Update an email template (persisted to SQL Server)"""
+    template = _templates_by_name.get(template_name)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+
+    updated = {
+        "subject": request.subject if request.subject is not None else template["subject"],
+        "body": request.body if request.body is not None else template["body"],
+        "description": request.description if request.description is not None else template["description"],
+        "is_active": request.is_active if request.is_active is not None else template["is_active"],
+    }
+
+    # Save first so memory never holds an edit the database doesn't
+    try:
+        await run_in_threadpool(sqlserver_db.save_email_template, template_name, **updated)
+    except Exception as e:
+        logger.error(f"Failed to save template {template_name}: {e}")
+        raise HTTPException(status_code=500, detail="Sunucu hatası oluştu")
+
+    template.update(updated, updated_at=datetime.now(timezone.utc).isoformat())
+    _compile_template(template)
+    return template
 
 
 # ============================================
 # NOTIFICATION ENDPOINTS
 # ============================================
 
+# Notification payloads are never mutated after validation, and unknown keys
+# are rejected up front instead of being parsed and dropped
+_NOTIFICATION_REQUEST_CONFIG = ConfigDict(frozen=True, extra="forbid")
+
+
 class NotificationRequest(BaseModel):
+    model_config = _NOTIFICATION_REQUEST_CONFIG
+
     template_name: str
     params: dict
 
 
 class OrderErrorNotificationRequest(BaseModel):
+    model_config = _NOTIFICATION_REQUEST_CONFIG
+
     order_code: str
     supplier: str
     error_message: str
 
 
 class OrderCompletedNotificationRequest(BaseModel):
+    model_config = _NOTIFICATION_REQUEST_CONFIG
+
     order_code: str
     supplier: str
     item_count: int
 
 
 class SystemAlertNotificationRequest(BaseModel):
+    model_config = _NOTIFICATION_REQUEST_CONFIG
+
     level: str  # warning, error, critical
     message: str
 
 
-def _send_notification_to_all_users(template_name: str, params: dict) -> dict:
-    """Send notification to all users with receive_notifications enabled"""
-    # Find template
-    template = None
-    for t in _templates_db:
-        if t["name"] == template_name:
-            template = t
-            break
+# Notification requests are queued and sent in bursts by _notification_worker
+_NOTIFICATION_QUEUE_MAXSIZE = 1000
+_notification_queue: asyncio.Queue = asyncio.Queue(maxsize=_NOTIFICATION_QUEUE_MAXSIZE)
+
+# Opted-in recipient emails - user create/update/delete reset it, the TTL
+# bounds staleness from edits made outside this API (e.g. init_db)
+_RECIPIENTS_CACHE_TTL_SECONDS = 300
+_recipients_cache = {"expires_at": 0.0, "emails": None}
+
+
+def _invalidate_recipients_cache() -> None:
+    """Drop the cached recipient list (after a user mutation)"""
+    _recipients_cache["emails"] = None
+
+
+async def _get_notification_recipients() -> Tuple[str, ...]:
+    """Opted-in recipient emails, from cache when fresh"""
+    now = time.monotonic()
+    emails = _recipients_cache["emails"]
+    if emails is None or _recipients_cache["expires_at"] <= now:
+        emails = tuple(await run_in_threadpool(sqlserver_db.get_notification_recipients))
+        _recipients_cache.update(emails=emails, expires_at=now + _RECIPIENTS_CACHE_TTL_SECONDS)
+    return emails
+
+
+# Job id -> status of recently queued notifications (oldest evicted first)
+_NOTIFICATION_JOBS_MAX_SIZE = 1024
+_notification_jobs: Dict[str, dict] = {}
+
 
+def _check_template(template_name: str) -> Optional[dict]:
+    """Error result if the template can't be sent, else None"""
+    template = _templates_by_name.get(template_name)
     if not template:
         return {"success": False, "error": f"Template not found: {template_name}"}
 
     if not template.get("is_active", True):
         return {"success": False, "error": "Template is disabled"}
+    return None
 
-    # Prepare subject and body
-    subject = template["subject"]
-    body = template["body"]
 
-    for key, value in params.items():
-        placeholder = "{" + key + "}"
-        subject = subject.replace(placeholder, str(value))
-        body = body.replace(placeholder, str(value))
+def _register_job(job_id: str, template_name: str) -> None:
+    """Start tracking a queued notification job"""
+    if len(_notification_jobs) >= _NOTIFICATION_JOBS_MAX_SIZE:
+        del _notification_jobs[next(iter(_notification_jobs))]
+    _notification_jobs[job_id] = {"status": "queued", "template": template_name}
 
-    # Get recipients from SQL Server
+
+def _enqueue_notification(template_name: str, params: dict) -> dict:
+    """Put a (validated) notification on the send queue"""
+    job_id = uuid.uuid4().hex
     try:
-        users = sqlserver_db.get_users()
-        recipients = [
-            user["email"]
-            for user in users
-            if user.get("receive_notifications", True) and user.get("is_active", True)
-        ]
-    except Exception:
-        recipients = []
+        _notification_queue.put_nowait((job_id, template_name, params))
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Notification queue is full")
+
+    _register_job(job_id, template_name)
+    return {"success": True, "status": "queued", "job_id": job_id, "template": template_name}
+
+
+def _queue_notification(template_name: str, params: dict) -> dict:
+    """Validate and queue a notification to all users with receive_notifications enabled"""
+    return _check_template(template_name) or _enqueue_notification(template_name, params)
+
+
+# order_error / order_completed: the first notification per (template, supplier)
+# goes out at once; later ones inside the window are sent as one summary
+_ORDER_COALESCE_SECONDS = 30
+_order_windows: Dict[Tuple[str, str], dict] = {}
+
 
+def _queue_order_notification(template_name: str, params: dict) -> dict:
+    """Queue an order notification, coalescing bursts for the same supplier"""
+    error = _check_template(template_name)
+    if error:
+        return error
+
+    key = (template_name, params["supplier"])
+    window = _order_windows.get(key)
+    if window is None:
+        _order_windows[key] = {"until": time.monotonic() + _ORDER_COALESCE_SECONDS, "items": [], "job_ids": []}
+        return _enqueue_notification(template_name, params)
+
+    job_id = uuid.uuid4().hex
+    _register_job(job_id, template_name)
+    window["items"].append(params)
+    window["job_ids"].append(job_id)
+    return {"success": True, "status": "queued", "job_id": job_id, "template": template_name, "coalesced": True}
+
+
+def _merge_order_params(template_name: str, items: List[dict]) -> dict:
+    """Template params for one summary covering several orders of a supplier"""
+    merged = {
+        "order_code": ", ".join(str(p["order_code"]) for p in items),
+        "supplier": items[0]["supplier"],
+    }
+    if template_name == "order_completed":
+        merged["item_count"] = sum(p["item_count"] for p in items)
+    else:
+        merged["error_message"] = "".join(f"\n- {p['order_code']}: {p['error_message']}" for p in items)
+    return merged
+
+
+def _flush_order_windows(force: bool = False) -> None:
+    """Queue a summary for every closed window that collected orders"""
+    now = time.monotonic()
+    for key, window in list(_order_windows.items()):
+        if window["until"] > now and not force:
+            continue
+        if not window["items"]:
+            del _order_windows[key]
+            continue
+
+        template_name = key[0]
+        try:
+            summary = _enqueue_notification(template_name, _merge_order_params(template_name, window["items"]))
+        except HTTPException as e:
+            for job_id in window["job_ids"]:
+                _set_job_status(job_id, "failed", error=e.detail)
+        else:
+            for job_id in window["job_ids"]:
+                _set_job_status(job_id, "coalesced", summary_job_id=summary["job_id"])
+
+        # Keep the supplier coalesced while the burst continues
+        _order_windows[key] = {"until": now + _ORDER_COALESCE_SECONDS, "items": [], "job_ids": []}
+        if force:
+            del _order_windows[key]
+
+
+async def _order_coalesce_worker() -> None:
+    """Close expired order notification windows (checked every second)"""
+    while True:
+        await asyncio.sleep(1)
+        _flush_order_windows()
+
+
+def _set_job_status(job_id: str, status: str, **fields) -> None:
+    """Record a job outcome (no-op if the job was already evicted)"""
+    job = _notification_jobs.get(job_id)
+    if job is not None:
+        job.update(fields, status=status)
+
+
+async def _dispatch_notifications(batch: List[Tuple[str, str, dict]]) -> None:
+    """Send a batch of queued notifications - identical messages go out once"""
+    recipients = await _get_notification_recipients()
     if not recipients:
-        return {"success": False, "error": "No recipients with notifications enabled"}
-
-    # Send emails
-    email_sender = EmailSender()
-    results = {}
-    success_count = 0
-    fail_count = 0
-
-    for recipient in recipients:
-        sent = email_sender.send_email(to=recipient, subject=subject, body=body)
-        results[recipient] = "sent" if sent else "failed"
-        if sent:
-            success_count += 1
+        logger.warning(f"[NOTIFICATION] {len(batch)} notification(s) dropped: no recipients with notifications enabled")
+        for job_id, _, _ in batch:
+            _set_job_status(job_id, "failed", error="No recipients with notifications enabled")
+        return
+
+    # Render each request, coalescing duplicates within the burst (order kept)
+    messages: Dict[Tuple[str, str], List[str]] = {}
+    for job_id, template_name, params in batch:
+        template = _templates_by_name.get(template_name)
+        if template and template.get("is_active", True):
+            messages.setdefault(render_template(template, params), []).append(job_id)
         else:
-            fail_count += 1
+            _set_job_status(job_id, "failed", error="Template not found or disabled")
+
+    # One SMTP transaction (single DATA, one RCPT per recipient) per message
+    results = await asyncio.gather(*(
+        run_in_threadpool(email_sender.send_bulk, recipients, subject, body)
+        for subject, body in messages
+    ))
+    for ((subject, _), job_ids), failed in zip(messages.items(), results):
+        failed_count = len(failed)
+        sent_count = len(recipients) - failed_count
+        status = "sent" if sent_count else "failed"
+        # The first job owns the send; duplicates point at it via merged_into
+        delivering_job_id = job_ids[0]
+        _set_job_status(
+            delivering_job_id, status,
+            sent_count=sent_count, failed_count=failed_count, failed_recipients=failed,
+        )
+        for job_id in job_ids[1:]:
+            _set_job_status(
+                job_id, status, merged_into=delivering_job_id,
+                sent_count=sent_count, failed_count=failed_count, failed_recipients=failed,
+            )
+        merged = f" (merged {len(job_ids) - 1} identical job(s) into {delivering_job_id})" if len(job_ids) > 1 else ""
+        logger.info(f"[NOTIFICATION] {subject}: sent to {sent_count}/{len(recipients)} recipient(s){merged}")
+
+
+async def _notification_worker() -> None:
+    """Drain the notification queue in batches (up to batch_size or batch_window_ms)"""
+    loop = asyncio.get_running_loop()
+    batch_size = settings.notification.batch_size
+    batch_window = settings.notification.batch_window_ms / 1000
+
+    while True:
+        batch = [await _notification_queue.get()]
+        deadline = loop.time() + batch_window
+        while len(batch) < batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_notification_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
 
-    return {
-        "success": success_count > 0,
-        "sent_count": success_count,
-        "failed_count": fail_count,
-        "recipients": results,
-        "template": template_name,
-    }
+        try:
+            await _dispatch_notifications(batch)
+        except Exception as e:
+            logger.error(f"[NOTIFICATION] Failed to send {len(batch)} notification(s): {e}")
+            for job_id, _, _ in batch:
+                _set_job_status(job_id, "failed", error=str(e))
+
+
+@app.get("/api/notifications/jobs/{job_id}")
+async def get_notification_job(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Get the delivery status of a queued notification"""
+    job = _notification_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Notification job not found")
+    return {"job_id": job_id, **job}
 
 
 @app.get("/api/notifications/recent")
@@ -1770,6 +2233,7 @@ async def get_recent_notifications(
                 "title": "Sipariş tamamlandı",
                 "message": f"{row[0]} - {(row[1] or '')[:30]} - Portal: {row[2] or 'N/A'}",
                 "time": time_str,
+                "_ts": t,
             })
 
         # Recent failed orders
@@ -1792,6 +2256,7 @@ async def get_recent_notifications(
                 "title": "Sipariş hatası",
                 "message": f"{row[0]} - {(row[2] or 'Bilinmeyen hata')[:50]}",
                 "time": time_str,
+                "_ts": t,
             })
 
         # Recent emails
@@ -1814,32 +2279,36 @@ async def get_recent_notifications(
                 "title": "Yeni sipariş e-postası",
                 "message": f"{(row[0] or '')[:50]}",
                 "time": time_str,
+                "_ts": t,
             })
 
-    # Sort by most recent (approximate via time string)
-    notifications.sort(key=lambda x: x["time"], reverse=False)
-    return {"notifications": notifications[:limit]}
+    # Most recent first by the row datetime (the display string doesn't sort)
+    notifications.sort(key=lambda x: x["_ts"] or datetime.min, reverse=True)
+    notifications = notifications[:limit]
+    for notification in notifications:
+        del notification["_ts"]
+    return {"notifications": notifications}
 
 
-@app.post("/api/notifications/send")
+@app.post("/api/notifications/send", status_code=202)
 async def send_notification(
     request: NotificationRequest,
     current_user: User = Depends(get_current_active_user)
 ):
-    """Send a notification to all users using a template"""
-    result = _send_notification_to_all_users(request.template_name, request.params)
+    """Queue a notification to all users using a template"""
+    result = _queue_notification(request.template_name, request.params)
     if not result["success"] and "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
     return result
 
 
-@app.post("/api/notifications/order-error")
+@app.post("/api/notifications/order-error", status_code=202)
 async def send_order_error_notification(
     request: OrderErrorNotificationRequest,
     current_user: User = Depends(get_current_active_user)
 ):
-    """Send order error notification to all users"""
-    result = _send_notification_to_all_users("order_error", {
+    """Queue order error notification to all users"""
+    result = _queue_order_notification("order_error", {
         "order_code": request.order_code,
         "supplier": request.supplier,
         "error_message": request.error_message,
@@ -1849,13 +2318,13 @@ async def send_order_error_notification(
     return result
 
 
-@app.post("/api/notifications/order-completed")
+@app.post("/api/notifications/order-completed", status_code=202)
 async def send_order_completed_notification(
     request: OrderCompletedNotificationRequest,
     current_user: User = Depends(get_current_active_user)
 ):
-    """Send order completed notification to all users"""
-    result = _send_notification_to_all_users("order_completed", {
+    """Queue order completed notification to all users"""
+    result = _queue_order_notification("order_completed", {
         "order_code": request.order_code,
         "supplier": request.supplier,
         "item_count": request.item_count,
@@ -1865,16 +2334,29 @@ async def send_order_completed_notification(
     return result
 
 
-@app.post("/api/notifications/system-alert")
+# Formatted UTC time for alerts, re-rendered at most once per second
+_alert_ts_cache = {"second": 0, "text": ""}
+
+
+def _utc_timestamp() -> str:
+    """Current UTC time as "YYYY-MM-DD HH:MM:SS" (cached per second)"""
+    now = int(time.time())
+    if now != _alert_ts_cache["second"]:
+        _alert_ts_cache["second"] = now
+        _alert_ts_cache["text"] = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now))
+    return _alert_ts_cache["text"]
+
+
+@app.post("/api/notifications/system-alert", status_code=202)
 async def send_system_alert_notification(
     request: SystemAlertNotificationRequest,
     current_user: User = Depends(get_current_active_user)
 ):
-    """Send system alert notification to all users"""
-    result = _send_notification_to_all_users("system_alert", {
+    """Queue system alert notification to all users"""
+    result = _queue_notification("system_alert", {
         "level": request.level,
         "message": request.message,
-        "timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        "timestamp": _utc_timestamp(),
     })
     if not result["success"] and "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
@@ -1986,14 +2468,38 @@ async def download_teccom_report(
     )
 
 
-# Startup/shutdown events
-@app.on_event("startup")
-async def startup():
-    """Startup event"""
-    pass
+# OpenAPI schema + docs (debug only)
+_OPENAPI_URL = "/openapi.json"
+_openapi_json: bytes = b""
+_openapi_gz: bytes = b""
+
+
+def _prepare_openapi():
+    """Generate the OpenAPI schema once and keep plain + gzipped bytes"""
+    global _openapi_json, _openapi_gz
+    _openapi_json = orjson.dumps(app.openapi())
+    _openapi_gz = gzip.compress(_openapi_json)
+
+
+if settings.debug:
+    from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
+
+    @app.get(_OPENAPI_URL, include_in_schema=False)
+    async def openapi_json(request: Request):
+        if not _openapi_json:
+            _prepare_openapi()
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            return Response(
+                content=_openapi_gz,
+                media_type="application/json",
+                headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+            )
+        return Response(content=_openapi_json, media_type="application/json")
 
+    @app.get("/api/docs", include_in_schema=False)
+    async def swagger_ui():
+        return get_swagger_ui_html(openapi_url=_OPENAPI_URL, title=f"{app.title} - Docs")
 
-@app.on_event("shutdown")
-async def shutdown():
-    """Shutdown event"""
-    pass
+    @app.get("/api/redoc", include_in_schema=False)
+    async def redoc():
+        return get_redoc_html(openapi_url=_OPENAPI_URL, title=f"{app.title} - ReDoc")
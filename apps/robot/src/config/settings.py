@@ -49,7 +49,9 @@ class EmailSettings(BaseSettings):
     user: str = ""
     password: str = ""
     use_ssl: bool = True
-    poll_interval: int = 60  # seconds
+    poll_interval: int = 60  # seconds (fallback when IDLE is unavailable)
+    use_idle: bool = True  # wait for new mail with IMAP IDLE push
+    fetch_batch_size: int = 100  # messages per IMAP FETCH
 
 
 class MutluAkuSettings(BaseSettings):
@@ -123,6 +125,8 @@ class NotificationSettings(BaseSettings):
         "asim.koc@dorufinansal.com"
     ]
     throttle_minutes: int = 60  # Same error notification throttle
+    batch_size: int = 64  # Max queued notifications dispatched together
+    batch_window_ms: int = 100  # How long to wait for a burst to fill a batch
 
 
 class PlaywrightSettings(BaseSettings):
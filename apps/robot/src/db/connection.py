@@ -63,3 +63,6 @@ async def init_db():
 async def close_db():
     """Close database connections"""
     await engine.dispose()
+
+    from src.db.sqlserver import db as sqlserver_db
+    sqlserver_db.close_pool()
@@ -3,23 +3,33 @@ SQL Server Database Helper for KolayRobot
 Provides direct database operations using pyodbc
 
 This module does not depend on SQLAlchemy async engine or aioodbc.
-It uses pyodbc for synchronous database connections.
+It uses pyodbc for synchronous database connections, reused through a
+small thread-safe connection pool.
 """
 
 import pyodbc
 from datetime import datetime
 from typing import Optional, List, Dict, Any, Tuple
 from contextlib import contextmanager
+import queue
+import time
 import uuid
 
 # Import settings directly to avoid circular imports through db.__init__
 from src.config.settings import settings
 
 
+# Connection pool settings
+POOL_MAX_SIZE = 20
+POOL_RECYCLE_SECONDS = 1800  # Reconnect before SQL Server idle timeouts
+
+
 class SQLServerDB:
-    """SQL Server database helper with direct pyodbc connections"""
+    """SQL Server database helper with pooled pyodbc connections"""
 
-    def __init__(self):
+    def __init__(self, pool_size: int = POOL_MAX_SIZE, pool_recycle: int = POOL_RECYCLE_SECONDS):
+        self._pool: queue.LifoQueue = queue.LifoQueue(maxsize=pool_size)
+        self._pool_recycle = pool_recycle
         self._connection_string = (
             f"DRIVER={{{settings.database.driver}}};"
             f"SERVER={settings.database.host},{settings.database.port};"
@@ -28,26 +38,83 @@ class SQLServerDB:
             f"PWD={settings.database.password};"
             f"TrustServerCertificate=yes;"
         )
+        # Bumped after every committed order write made through this process
+        # (API and workers) - lets the API stats cache notice worker changes
+        self.orders_version = 0
 
     def get_connection(self) -> pyodbc.Connection:
         """Get a new database connection"""
         return pyodbc.connect(self._connection_string)
 
+    def _acquire(self) -> Tuple[pyodbc.Connection, float]:
+        """Take a connection from the pool, opening a new one if empty"""
+        while True:
+            try:
+                conn, created_at = self._pool.get_nowait()
+            except queue.Empty:
+                return self.get_connection(), time.monotonic()
+
+            if time.monotonic() - created_at < self._pool_recycle:
+                return conn, created_at
+            self._close_quietly(conn)
+
+    def _release(self, conn: pyodbc.Connection, created_at: float) -> None:
+        """Return a connection to the pool (closed if the pool is full)"""
+        try:
+            self._pool.put_nowait((conn, created_at))
+        except queue.Full:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn: pyodbc.Connection) -> None:
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+
+    def warm_pool(self) -> None:
+        """Open one connection up front so the first request doesn't pay for it"""
+        conn, created_at = self._acquire()
+        self._release(conn, created_at)
+
+    def close_pool(self) -> None:
+        """Close all pooled connections"""
+        while True:
+            try:
+                conn, _ = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            self._close_quietly(conn)
+
     @contextmanager
     def get_cursor(self, commit: bool = False):
-        """Context manager for database cursor"""
-        conn = self.get_connection()
+        """Context manager for database cursor (pooled connection)"""
+        conn, created_at = self._acquire()
         cursor = conn.cursor()
+        reusable = True
         try:
             yield cursor
             if commit:
                 conn.commit()
         except Exception:
-            conn.rollback()
+            try:
+                conn.rollback()
+            except pyodbc.Error:
+                reusable = False
             raise
         finally:
-            cursor.close()
-            conn.close()
+            try:
+                cursor.close()
+                if not commit:
+                    # End the implicit read transaction before reuse
+                    conn.rollback()
+            except pyodbc.Error:
+                reusable = False
+
+            if reusable:
+                self._release(conn, created_at)
+            else:
+                self._close_quietly(conn)
 
     def _rows_to_dicts(self, cursor, rows) -> List[Dict[str, Any]]:
         """Convert cursor rows to list of dicts"""
@@ -68,11 +135,19 @@ class SQLServerDB:
                 ORDER BY created_at DESC
             """)
             rows = cursor.fetchall()
-            users = self._rows_to_dicts(cursor, rows)
-            for user in users:
-                if user.get('created_at'):
-                    user['created_at'] = user['created_at'].isoformat() if isinstance(user['created_at'], datetime) else str(user['created_at'])
-            return users
+            # datetimes stay native - the API's orjson responses encode them
+            return self._rows_to_dicts(cursor, rows)
+
+    def get_notification_recipients(self) -> List[str]:
+        """Emails of active users who opted in to notifications"""
+        with self.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT email
+                FROM users
+                WHERE is_active = 1 AND receive_notifications = 1
+                ORDER BY created_at DESC
+            """)
+            return [row[0] for row in cursor.fetchall()]
 
     def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
         """Get user by username"""
@@ -125,16 +200,42 @@ class SQLServerDB:
                 return user
             return None
 
+    def find_user_conflict(self, username: str, email: str) -> Optional[str]:
+        """Return 'username' or 'email' if already taken (one query for both checks)"""
+        with self.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT TOP 1 CASE WHEN username = ? THEN 'username' ELSE 'email' END
+                FROM users
+                WHERE username = ? OR email = ?
+                ORDER BY CASE WHEN username = ? THEN 0 ELSE 1 END
+            """, (username, username, email, username))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
     def create_user(self, username: str, email: str, hashed_password: str,
-                    full_name: str = "", role: str = "user") -> Dict[str, Any]:
-        """Create a new user"""
+                    full_name: str = "", role: str = "user") -> Optional[Dict[str, Any]]:
+        """
+        Create a new user unless the username or email is already taken
+
+        The uniqueness check and insert are one statement; UPDLOCK/HOLDLOCK keep
+        a concurrent request from inserting the same username/email in between.
+
+        Returns:
+            Created user, or None on conflict (see find_user_conflict)
+        """
         with self.get_cursor(commit=True) as cursor:
             cursor.execute("""
                 INSERT INTO users (username, email, password_hash, full_name, role, is_active, receive_notifications, created_at)
                 OUTPUT INSERTED.id, INSERTED.username, INSERTED.email, INSERTED.full_name, INSERTED.role, INSERTED.is_active, INSERTED.receive_notifications, INSERTED.created_at
-                VALUES (?, ?, ?, ?, ?, 1, 1, GETDATE())
-            """, (username, email, hashed_password, full_name, role))
+                SELECT ?, ?, ?, ?, ?, 1, 1, GETDATE()
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM users WITH (UPDLOCK, HOLDLOCK)
+                    WHERE username = ? OR email = ?
+                )
+            """, (username, email, hashed_password, full_name, role, username, email))
             row = cursor.fetchone()
+            if row is None:
+                return None
             user = dict(zip([column[0] for column in cursor.description], row))
             if user.get('created_at'):
                 user['created_at'] = user['created_at'].isoformat() if isinstance(user['created_at'], datetime) else str(user['created_at'])
@@ -162,11 +263,22 @@ class SQLServerDB:
 
         return self.get_user_by_id(user_id)
 
-    def delete_user(self, user_id: int) -> bool:
-        """Delete a user"""
+    def delete_user(self, user_id: int, protected_username: Optional[str] = None) -> Optional[str]:
+        """
+        Delete a user in a single statement
+
+        Returns:
+            Username of the deleted user, or None if no row matched (missing id,
+            or the user is protected_username)
+        """
         with self.get_cursor(commit=True) as cursor:
-            cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-            return cursor.rowcount > 0
+            cursor.execute("""
+                DELETE FROM users
+                OUTPUT DELETED.username
+                WHERE id = ? AND (? IS NULL OR username <> ?)
+            """, (user_id, protected_username, protected_username))
+            row = cursor.fetchone()
+            return row[0] if row else None
 
     # ============================================
     # EMAIL OPERATIONS
@@ -199,11 +311,8 @@ class SQLServerDB:
             rows = cursor.fetchall()
             emails = self._rows_to_dicts(cursor, rows)
 
+            # datetimes stay native - the API's orjson responses encode them
             for email in emails:
-                if email.get('received_at'):
-                    email['received_at'] = email['received_at'].isoformat() if isinstance(email['received_at'], datetime) else str(email['received_at'])
-                if email.get('created_at'):
-                    email['created_at'] = email['created_at'].isoformat() if isinstance(email['created_at'], datetime) else str(email['created_at'])
                 if email.get('status'):
                     email['status'] = email['status'].lower()
 
@@ -282,11 +391,8 @@ class SQLServerDB:
             rows = cursor.fetchall()
             orders = self._rows_to_dicts(cursor, rows)
 
+            # datetimes stay native - the API's orjson responses encode them
             for order in orders:
-                if order.get('created_at'):
-                    order['created_at'] = order['created_at'].isoformat() if isinstance(order['created_at'], datetime) else str(order['created_at'])
-                if order.get('completed_at'):
-                    order['completed_at'] = order['completed_at'].isoformat() if isinstance(order['completed_at'], datetime) else str(order['completed_at'])
                 if order.get('status'):
                     order['status'] = order['status'].lower()
                 # Calculate total_amount as 0 for now (not in schema)
@@ -294,6 +400,54 @@ class SQLServerDB:
 
             return orders, total
 
+    def ensure_list_indexes(self) -> None:
+        """
+        Create the secondary indexes behind the paginated order/email/audit lists
+        and the per-order log timeline
+
+        Lists are read newest first, optionally filtered: with the sort column
+        indexed (behind the filter column) a page is an index range scan in
+        order instead of a scan and sort of the whole table.
+        """
+        with self.get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_orders_status_created_at'
+                               AND object_id = OBJECT_ID('orders'))
+                    CREATE INDEX IX_orders_status_created_at ON orders (status, created_at DESC);
+
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_orders_supplier_type_created_at'
+                               AND object_id = OBJECT_ID('orders'))
+                    CREATE INDEX IX_orders_supplier_type_created_at ON orders (supplier_type, created_at DESC);
+
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_orders_created_at'
+                               AND object_id = OBJECT_ID('orders'))
+                    CREATE INDEX IX_orders_created_at ON orders (created_at DESC);
+
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_emails_received_at'
+                               AND object_id = OBJECT_ID('emails'))
+                    CREATE INDEX IX_emails_received_at ON emails (received_at DESC);
+
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_emails_status_received_at'
+                               AND object_id = OBJECT_ID('emails'))
+                    CREATE INDEX IX_emails_status_received_at ON emails (status, received_at DESC);
+
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_audit_logs_created_at'
+                               AND object_id = OBJECT_ID('audit_logs'))
+                    CREATE INDEX IX_audit_logs_created_at ON audit_logs (created_at DESC);
+
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_audit_logs_action_created_at'
+                               AND object_id = OBJECT_ID('audit_logs'))
+                    CREATE INDEX IX_audit_logs_action_created_at ON audit_logs (action, created_at DESC);
+
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_audit_logs_user_id_created_at'
+                               AND object_id = OBJECT_ID('audit_logs'))
+                    CREATE INDEX IX_audit_logs_user_id_created_at ON audit_logs (user_id, created_at DESC);
+
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_order_logs_order_id_created_at'
+                               AND object_id = OBJECT_ID('order_logs'))
+                    CREATE INDEX IX_order_logs_order_id_created_at ON order_logs (order_id, created_at);
+            """)
+
     def get_order_by_id(self, order_id: str) -> Optional[Dict[str, Any]]:
         """Get order by ID"""
         with self.get_cursor() as cursor:
@@ -348,6 +502,7 @@ class SQLServerDB:
             """, (order_code, email_id, supplier_type, customer_code, customer_name,
                   total_items, attachment_filename, attachment_path))
             order_id = cursor.fetchone()[0]
+        self.orders_version += 1
         return self.get_order_by_id(order_id)
 
     def update_order_status(self, order_id: str, status: str, error_message: str = None,
@@ -372,7 +527,46 @@ class SQLServerDB:
                     SET status = ?, error_message = NULL
                     WHERE id = ?
                 """, (status.upper(), order_id))
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+        self.orders_version += 1
+        return updated
+
+    def claim_order(self, order_id: str, from_statuses: Tuple[str, ...] = ('PENDING',)) -> bool:
+        """Atomically move an order to PROCESSING - False if it was claimed elsewhere"""
+        placeholders = ", ".join("?" * len(from_statuses))
+        with self.get_cursor(commit=True) as cursor:
+            cursor.execute(f"""
+                UPDATE orders
+                SET status = 'PROCESSING', error_message = NULL
+                WHERE id = ? AND status IN ({placeholders})
+            """, (order_id, *from_statuses))
+            claimed = cursor.rowcount > 0
+        self.orders_version += 1
+        return claimed
+
+    def fail_interrupted_orders(self, error_message: str) -> int:
+        """Mark PROCESSING orders FAILED - a run cut off mid-way needs review, not a re-run"""
+        with self.get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                UPDATE orders
+                SET status = 'FAILED', error_message = ?
+                WHERE status = 'PROCESSING'
+            """, (error_message,))
+            failed = cursor.rowcount
+        self.orders_version += 1
+        return failed
+
+    def get_pending_orders(self) -> List[Dict[str, Any]]:
+        """Get PENDING orders, oldest first - queued on worker startup"""
+        with self.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT id, order_code, supplier_type, customer_code, customer_name,
+                       attachment_filename, attachment_path
+                FROM orders
+                WHERE status = 'PENDING'
+                ORDER BY created_at ASC
+            """)
+            return self._rows_to_dicts(cursor, cursor.fetchall())
 
     def get_order_logs(self, order_id: str) -> List[Dict[str, Any]]:
         """Get logs for an order"""
@@ -386,10 +580,11 @@ class SQLServerDB:
             rows = cursor.fetchall()
             logs = self._rows_to_dicts(cursor, rows)
 
+            # Datetimes are left as-is - the API's ORJSONResponse emits ISO-8601
             for i, log in enumerate(logs):
                 log['step'] = i + 1
                 if log.get('created_at'):
-                    log['timestamp'] = log['created_at'].isoformat() if isinstance(log['created_at'], datetime) else str(log['created_at'])
+                    log['timestamp'] = log['created_at']
                 if log.get('screenshot_path'):
                     log['screenshot'] = log['screenshot_path']
 
@@ -430,10 +625,13 @@ class SQLServerDB:
             if where_conditions:
                 where_clause = "WHERE " + " AND ".join(where_conditions)
 
+            # The users join only matters for the count when filtering by username
+            # (LEFT JOIN on users.id never changes the row count)
+            count_join = "LEFT JOIN users u ON a.user_id = u.id" if user else ""
             cursor.execute(f"""
                 SELECT COUNT(*)
                 FROM audit_logs a
-                LEFT JOIN users u ON a.user_id = u.id
+                {count_join}
                 {where_clause}
             """, params)
             total = cursor.fetchone()[0]
@@ -449,14 +647,9 @@ class SQLServerDB:
                 OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
             """, params + [offset, page_size])
 
+            # Datetimes are left as-is - the API's ORJSONResponse emits ISO-8601
             rows = cursor.fetchall()
-            logs = self._rows_to_dicts(cursor, rows)
-
-            for log in logs:
-                if log.get('timestamp'):
-                    log['timestamp'] = log['timestamp'].isoformat() if isinstance(log['timestamp'], datetime) else str(log['timestamp'])
-
-            return logs, total
+            return self._rows_to_dicts(cursor, rows), total
 
     def create_audit_log(self, user_id: Optional[int], action: str, resource_type: str = None,
                          resource_id: str = None, details: str = None, ip_address: str = None) -> str:
@@ -477,42 +670,44 @@ class SQLServerDB:
     # ============================================
 
     def get_today_stats(self) -> Dict[str, int]:
-        """Get today's statistics"""
+        """
+        Get today's statistics
+
+        One round trip: today's order/email counts, then the open orders
+        grouped by supplier and status (pending total and queues in one pass).
+        """
         with self.get_cursor() as cursor:
             cursor.execute("""
+                SET NOCOUNT ON;
+                DECLARE @today DATETIME = CAST(CAST(GETDATE() AS DATE) AS DATETIME);
+                DECLARE @tomorrow DATETIME = DATEADD(day, 1, @today);
+
                 SELECT
                     COUNT(*) as today_orders,
                     SUM(CASE WHEN status = 'COMPLETED' THEN 1 ELSE 0 END) as today_successful,
-                    SUM(CASE WHEN status = 'FAILED' THEN 1 ELSE 0 END) as today_failed
+                    SUM(CASE WHEN status = 'FAILED' THEN 1 ELSE 0 END) as today_failed,
+                    (SELECT COUNT(*) FROM emails
+                     WHERE created_at >= @today AND created_at < @tomorrow) as today_emails
                 FROM orders
-                WHERE CAST(created_at AS DATE) = CAST(GETDATE() AS DATE)
-            """)
-            order_stats = cursor.fetchone()
-
-            cursor.execute("""
-                SELECT COUNT(*) FROM orders WHERE status IN ('PENDING', 'PROCESSING')
-            """)
-            pending = cursor.fetchone()[0]
+                WHERE created_at >= @today AND created_at < @tomorrow;
 
-            # Get queue counts by supplier_type (direct column, not foreign key)
-            cursor.execute("""
-                SELECT supplier_type, COUNT(*) as count
+                SELECT supplier_type, status, COUNT(*) as count
                 FROM orders
-                WHERE status = 'PENDING'
-                GROUP BY supplier_type
+                WHERE status IN ('PENDING', 'PROCESSING')
+                GROUP BY supplier_type, status;
             """)
-            queue_rows = cursor.fetchall()
-            queue_counts = {}
-            for row in queue_rows:
-                if row[0]:
-                    key = row[0].lower().replace('-', '_')
-                    queue_counts[key] = row[1]
+            order_stats = cursor.fetchone()
+            today_emails = order_stats[3]
 
-            cursor.execute("""
-                SELECT COUNT(*) FROM emails
-                WHERE CAST(created_at AS DATE) = CAST(GETDATE() AS DATE)
-            """)
-            today_emails = cursor.fetchone()[0]
+            cursor.nextset()
+            pending = 0
+            queue_counts = {}
+            for supplier_type, status, count in cursor.fetchall():
+                pending += count
+                # Queue counts by supplier_type (direct column, not foreign key)
+                if status == 'PENDING' and supplier_type:
+                    key = supplier_type.lower().replace('-', '_')
+                    queue_counts[key] = queue_counts.get(key, 0) + count
 
             return {
                 'today_orders': order_stats[0] or 0,
@@ -558,5 +753,53 @@ class SQLServerDB:
             return None
 
 
+    # ============================================
+    # EMAIL TEMPLATE OPERATIONS
+    # ============================================
+
+    def ensure_email_templates_table(self) -> None:
+        """Create the email_templates table if it doesn't exist"""
+        with self.get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                IF OBJECT_ID('email_templates', 'U') IS NULL
+                CREATE TABLE email_templates (
+                    name NVARCHAR(100) NOT NULL PRIMARY KEY,
+                    subject NVARCHAR(255) NOT NULL,
+                    body NVARCHAR(MAX) NOT NULL,
+                    description NVARCHAR(MAX) NULL,
+                    is_active BIT NOT NULL DEFAULT 1,
+                    updated_at DATETIME NOT NULL DEFAULT GETDATE()
+                )
+            """)
+
+    def get_email_templates(self) -> List[Dict[str, Any]]:
+        """Get saved (edited) email templates"""
+        with self.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT name, subject, body, description, is_active, updated_at
+                FROM email_templates
+            """)
+            rows = cursor.fetchall()
+            templates = self._rows_to_dicts(cursor, rows)
+            for template in templates:
+                if template.get('updated_at'):
+                    template['updated_at'] = template['updated_at'].isoformat() if isinstance(template['updated_at'], datetime) else str(template['updated_at'])
+            return templates
+
+    def save_email_template(self, name: str, subject: str, body: str,
+                            description: str, is_active: bool) -> None:
+        """Insert or update an email template"""
+        with self.get_cursor(commit=True) as cursor:
+            cursor.execute("""
+                MERGE email_templates WITH (HOLDLOCK) AS t
+                USING (SELECT ? AS name) AS s ON t.name = s.name
+                WHEN MATCHED THEN
+                    UPDATE SET subject = ?, body = ?, description = ?, is_active = ?, updated_at = GETDATE()
+                WHEN NOT MATCHED THEN
+                    INSERT (name, subject, body, description, is_active, updated_at)
+                    VALUES (s.name, ?, ?, ?, ?, GETDATE());
+            """, (name, subject, body, description, is_active, subject, body, description, is_active))
+
+
 # Global database instance
 db = SQLServerDB()
@@ -5,11 +5,13 @@ IMAP-based email fetching service for order emails
 
 import asyncio
 import email
+import threading
+import time
 from email.header import decode_header
 from email.message import Message
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Optional, Tuple, Dict, Any
+from typing import Callable, List, Optional, Tuple, Dict, Any
 import uuid
 
 from imapclient import IMAPClient
@@ -18,6 +20,10 @@ import ssl
 from src.config import settings
 from src.utils.logger import logger, email_logger
 
+# IMAP IDLE timing (RFC 2177 recommends re-issuing IDLE before 30 minutes)
+IDLE_CHECK_SECONDS = 5
+IDLE_RENEW_SECONDS = 29 * 60
+
 
 class EmailFetcher:
     """
@@ -126,6 +132,17 @@ class EmailFetcher:
                 if "attachment" in content_disposition:
                     continue
 
+                # Only text parts are kept - don't decode inline images etc.
+                if content_type not in ("text/plain", "text/html"):
+                    continue
+
+                # The first text and HTML parts are the message's own body;
+                # later ones belong to forwarded/attached messages
+                if content_type == "text/plain" and text_body:
+                    continue
+                if content_type == "text/html" and html_body:
+                    continue
+
                 try:
                     payload = part.get_payload(decode=True)
                     if payload:
@@ -138,6 +155,9 @@ class EmailFetcher:
                             html_body = decoded
                 except Exception as e:
                     email_logger.warning(f"Error decoding email part: {e}")
+
+                if text_body and html_body:
+                    break
         else:
             # Single part message
             try:
@@ -281,12 +301,19 @@ class EmailFetcher:
             # Limit number of messages
             new_messages = new_messages[:limit]
 
-            # Fetch full messages
-            for msg_id in new_messages:
+            # Fetch full messages in batches - one FETCH round-trip per batch
+            response = {}
+            batch_size = settings.email.fetch_batch_size
+            for start in range(0, len(new_messages), batch_size):
+                batch = new_messages[start:start + batch_size]
                 try:
-                    # Fetch email data
-                    response = self.client.fetch([msg_id], ['RFC822', 'INTERNALDATE'])
+                    response.update(self.client.fetch(batch, ['RFC822', 'INTERNALDATE']))
+                except Exception as e:
+                    email_logger.error(f"Error fetching batch of {len(batch)} emails: {e}")
 
+            read_ids = []
+            for msg_id in new_messages:
+                try:
                     if msg_id not in response:
                         continue
 
@@ -341,14 +368,17 @@ class EmailFetcher:
                         f"({len(attachments)} attachments)"
                     )
 
-                    # Mark as read if requested
+                    # Mark as read if requested (flagged in one command below)
                     if mark_as_read:
-                        self.client.add_flags([msg_id], ['\\Seen'])
+                        read_ids.append(msg_id)
 
                 except Exception as e:
                     email_logger.error(f"Error processing email {msg_id}: {e}")
                     continue
 
+            if read_ids:
+                self.client.add_flags(read_ids, ['\\Seen'])
+
         except Exception as e:
             email_logger.error(f"Error fetching emails: {e}")
             raise
@@ -426,6 +456,57 @@ class EmailFetcher:
             email_logger.error(f"Error marking email {uid} as read: {e}")
             return False
 
+    def supports_idle(self) -> bool:
+        """Check if server advertises IDLE capability"""
+        return self.client is not None and self.client.has_capability('IDLE')
+
+    async def idle_wait(self, stop_event: asyncio.Event, folder: str = "INBOX") -> bool:
+        """
+        Wait in IMAP IDLE until the server pushes new mail
+
+        Returns after IDLE_RENEW_SECONDS at the latest so the caller can
+        re-issue IDLE (and run a safety-net poll).
+
+        Args:
+            stop_event: Event that aborts the wait when set
+            folder: IMAP folder name
+
+        Returns:
+            True if the server reported new messages
+        """
+        if not self.client:
+            raise RuntimeError("Not connected to IMAP server")
+
+        # The whole session runs in one thread so the socket is never used
+        # from two places; the stop flags are checked between idle_checks
+        cancelled = threading.Event()
+        session = asyncio.ensure_future(asyncio.to_thread(
+            self._idle_session, folder, lambda: stop_event.is_set() or cancelled.is_set()
+        ))
+        try:
+            return await asyncio.shield(session)
+        except asyncio.CancelledError:
+            # Let the in-flight idle_check finish and the thread send DONE itself
+            cancelled.set()
+            await asyncio.wait([session])
+            raise
+
+    def _idle_session(self, folder: str, should_stop: Callable[[], bool]) -> bool:
+        """Blocking IDLE session: select, IDLE, check until mail/stop/renewal, DONE"""
+        self.client.select_folder(folder, readonly=True)
+        self.client.idle()
+
+        deadline = time.monotonic() + IDLE_RENEW_SECONDS
+        try:
+            while not should_stop() and time.monotonic() < deadline:
+                for response in self.client.idle_check(IDLE_CHECK_SECONDS):
+                    if len(response) > 1 and response[1] in (b'EXISTS', b'RECENT'):
+                        email_logger.debug(f"IDLE notification: {response}")
+                        return True
+            return False
+        finally:
+            self.client.idle_done()
+
     async def check_connection(self) -> bool:
         """Check if connection is alive"""
         if not self.client:
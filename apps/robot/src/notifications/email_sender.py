@@ -3,28 +3,43 @@ KolayRobot Email Sender
 SMTP-based email notification service
 """
 
+import queue
 import smtplib
 import secrets
 import string
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Sequence, Tuple
 
 from src.config import settings
 from src.utils.logger import logger
 
 
+# SMTP session pool - at most this many sessions are open (and sending) at once
+SMTP_POOL_SIZE = 4
+# An SMTP session idle longer than this is NOOP-checked before reuse
+SMTP_IDLE_CHECK_SECONDS = 30
+
+
 class EmailSender:
     """
     Email sender service using SMTP
+
+    Keeps up to SMTP_POOL_SIZE authenticated SMTP sessions open across sends
+    (connect, STARTTLS and login happen once per session); concurrent sends
+    each take a session from the pool, further senders wait for one.
     """
 
-    def __init__(self):
+    def __init__(self, pool_size: int = SMTP_POOL_SIZE):
         self.smtp_host = settings.notification.smtp_host
         self.smtp_port = settings.notification.smtp_port
         self.smtp_user = settings.notification.smtp_user
         self.smtp_password = settings.notification.smtp_password
         self.enabled = settings.notification.enabled
+        self._pool: queue.LifoQueue = queue.LifoQueue(maxsize=pool_size)
+        self._slots = threading.BoundedSemaphore(pool_size)
 
     def _connect(self) -> Optional[smtplib.SMTP]:
         """Create SMTP connection"""
@@ -45,6 +60,106 @@ class EmailSender:
             logger.error(f"Failed to connect to SMTP server: {e}")
             return None
 
+    def _acquire(self) -> Optional[smtplib.SMTP]:
+        """Take an open session from the pool, connecting if none is usable (slot held)"""
+        while True:
+            try:
+                server, last_used = self._pool.get_nowait()
+            except queue.Empty:
+                return self._connect()
+
+            if time.monotonic() - last_used < SMTP_IDLE_CHECK_SECONDS:
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close_quietly(server)
+
+    def _release(self, server: smtplib.SMTP) -> None:
+        """Return a session to the pool (slot held)"""
+        try:
+            self._pool.put_nowait((server, time.monotonic()))
+        except queue.Full:
+            self._close_quietly(server)
+
+    @staticmethod
+    def _close_quietly(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+    def close(self) -> None:
+        """Close all pooled SMTP sessions"""
+        while True:
+            try:
+                server, _ = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            self._close_quietly(server)
+
+    def _build_message(
+        self,
+        to: str,
+        subject: str,
+        body: str,
+        html_body: Optional[str] = None
+    ) -> bytes:
+        """Build the encoded MIME message for one recipient (sent as-is by sendmail)"""
+        msg = MIMEMultipart("alternative")
+        msg["Subject"] = subject
+        msg["From"] = self.smtp_user
+        msg["To"] = to
+
+        # Plain text part
+        part1 = MIMEText(body, "plain", "utf-8")
+        msg.attach(part1)
+
+        # HTML part (optional)
+        if html_body:
+            part2 = MIMEText(html_body, "html", "utf-8")
+            msg.attach(part2)
+
+        return msg.as_bytes()
+
+    def _send_batch(self, messages: List[Tuple[str, bytes]], subject: str) -> Dict[str, bool]:
+        """Send (recipient, message) pairs over one pooled session"""
+        results = {to: False for to, _ in messages}
+
+        with self._slots:
+            server = self._acquire()
+            if not server:
+                logger.warning(f"Email not sent (SMTP not configured): {subject}")
+                return results
+
+            try:
+                for to, message in messages:
+                    try:
+                        try:
+                            server.sendmail(self.smtp_user, to, message)
+                        except smtplib.SMTPServerDisconnected:
+                            # Server dropped the session - reconnect once
+                            server = self._connect()
+                            if not server:
+                                raise
+                            server.sendmail(self.smtp_user, to, message)
+                    except smtplib.SMTPServerDisconnected as e:
+                        logger.error(f"Failed to send email: {e}")
+                        server = None
+                        return results
+                    except Exception as e:
+                        logger.error(f"Failed to send email: {e}")
+                        continue
+                    results[to] = True
+                    logger.info(f"Email sent to {to}: {subject}")
+            finally:
+                if server:
+                    self._release(server)
+
+        return results
+
     def send_email(
         self,
         to: str,
@@ -64,35 +179,53 @@ class EmailSender:
         Returns:
             True if sent successfully
         """
-        server = self._connect()
-        if not server:
-            logger.warning(f"Email not sent (SMTP not configured): {subject}")
-            return False
-
-        try:
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = subject
-            msg["From"] = self.smtp_user
-            msg["To"] = to
+        message = self._build_message(to, subject, body, html_body)
+        return self._send_batch([(to, message)], subject)[to]
 
-            # Plain text part
-            part1 = MIMEText(body, "plain", "utf-8")
-            msg.attach(part1)
+    def send_bulk(
+        self,
+        recipients: Sequence[str],
+        subject: str,
+        body: str
+    ) -> List[str]:
+        """
+        Send one message to many recipients in a single SMTP transaction
 
-            # HTML part (optional)
-            if html_body:
-                part2 = MIMEText(html_body, "html", "utf-8")
-                msg.attach(part2)
+        One MAIL FROM, a RCPT TO per recipient and a single DATA; recipients
+        are not listed in the headers. Returns the recipients it failed for.
+        """
+        if not recipients:
+            return []
+        message = self._build_message("undisclosed-recipients:;", subject, body)
 
-            server.sendmail(self.smtp_user, to, msg.as_string())
-            server.quit()
+        with self._slots:
+            server = self._acquire()
+            if not server:
+                logger.warning(f"Email not sent (SMTP not configured): {subject}")
+                return list(recipients)
 
-            logger.info(f"Email sent to {to}: {subject}")
-            return True
+            try:
+                try:
+                    refused = server.sendmail(self.smtp_user, recipients, message)
+                except smtplib.SMTPServerDisconnected:
+                    # Server dropped the session - reconnect once
+                    server = self._connect()
+                    if not server:
+                        raise
+                    refused = server.sendmail(self.smtp_user, recipients, message)
+            except smtplib.SMTPServerDisconnected as e:
+                logger.error(f"Failed to send email: {e}")
+                server = None
+                return list(recipients)
+            except Exception as e:
+                logger.error(f"Failed to send email: {e}")
+                return list(recipients)
+            finally:
+                if server:
+                    self._release(server)
 
-        except Exception as e:
-            logger.error(f"Failed to send email: {e}")
-            return False
+        logger.info(f"Email sent to {len(recipients) - len(refused)} recipient(s): {subject}")
+        return list(refused)
 
     def send_to_multiple(
         self,
@@ -100,11 +233,13 @@ class EmailSender:
         subject: str,
         body: str
     ) -> Dict[str, bool]:
-        """Send email to multiple recipients"""
-        results = {}
-        for recipient in recipients:
-            results[recipient] = self.send_email(recipient, subject, body)
-        return results
+        """Send email to multiple recipients over a single SMTP session"""
+        messages = [(to, self._build_message(to, subject, body)) for to in recipients]
+        return self._send_batch(messages, subject)
+
+
+# Shared sender - reuse it instead of creating one (and a connection) per send
+email_sender = EmailSender()
 
 
 def generate_random_password(length: int = 12) -> str:
@@ -130,28 +265,60 @@ def send_notification_email(
         True if sent successfully
     """
     # Import here to avoid circular imports
-    from src.api.main import _templates_db
+    from src.api.main import _templates_by_name, render_template
 
-    # Find template
-    template = None
-    for t in _templates_db:
-        if t["name"] == template_name:
-            template = t
-            break
+    template = _templates_by_name.get(template_name)
 
     if not template:
         logger.error(f"Template not found: {template_name}")
         return False
 
     # Interpolate template
-    subject = template["subject"]
-    body = template["body"]
-
-    for key, value in params.items():
-        placeholder = "{" + key + "}"
-        subject = subject.replace(placeholder, str(value))
-        body = body.replace(placeholder, str(value))
+    subject, body = render_template(template, params)
 
     # Send email
-    sender = EmailSender()
-    return sender.send_email(to, subject, body)
+    return email_sender.send_email(to, subject, body)
+
+
+def send_order_result_email(order_info: Dict[str, Any], result: Any) -> None:
+    """
+    Notify the configured recipients that an order finished processing
+
+    Shared by EmailWorker and OrderWorker. Blocking - call it via asyncio.to_thread
+    from async code.
+
+    Args:
+        order_info: Order info dict (order_code, supplier_type, db_id)
+        result: RobotResult of the processing run
+    """
+    try:
+        order_code = order_info.get('order_code', '')
+        supplier = order_info.get('supplier_type', '')
+        db_id = order_info.get('db_id') or order_info.get('id', '')
+        supplier_name = "Mann & Hummel" if supplier == "MANN" else "Mutlu Akü" if supplier == "MUTLU" else supplier
+        order_url = f"https://kolayrobot.com/dashboard/orders/{db_id}" if db_id else "https://kolayrobot.com/dashboard/orders"
+
+        if result.success:
+            subject = f"Sipariş Tamamlandı: {order_code} - {supplier_name}"
+            body = (
+                f"Sipariş başarıyla işlendi:\n\n"
+                f"Sipariş Kodu: {order_code}\n"
+                f"Tedarikçi: {supplier_name}\n"
+                f"Portal Sipariş No: {result.portal_order_no}\n"
+                f"Süre: {result.duration_seconds:.0f} saniye\n\n"
+                f"Sipariş Detay: {order_url}\n"
+            )
+        else:
+            subject = f"Sipariş HATA: {order_code} - {supplier_name}"
+            body = (
+                f"Sipariş işlenirken hata oluştu:\n\n"
+                f"Sipariş Kodu: {order_code}\n"
+                f"Tedarikçi: {supplier_name}\n"
+                f"Hata: {result.message}\n\n"
+                f"Sipariş Detay: {order_url}\n"
+            )
+
+        email_sender.send_to_multiple(settings.notification.recipients, subject, body)
+        logger.info(f"Order completion notification sent for {order_code}")
+    except Exception as e:
+        logger.error(f"Failed to send completion notification: {e}")
@@ -11,7 +11,12 @@ from src.config import settings
 
 
 def setup_logging() -> None:
-    """Configure application logging"""
+    """
+    Configure application logging
+
+    All sinks use enqueue=True: records are handed to a background thread,
+    so logging calls never block the event loop on file/terminal I/O.
+    """
 
     # Remove default handler
     loguru_logger.remove()
@@ -22,6 +27,7 @@ def setup_logging() -> None:
         format=settings.log.format,
         level=settings.log.level,
         colorize=True,
+        enqueue=True,
         backtrace=True,
         diagnose=settings.debug
     )
@@ -38,6 +44,7 @@ def setup_logging() -> None:
         rotation=settings.log.rotation,
         retention=settings.log.retention,
         compression=settings.log.compression,
+        enqueue=True,
         backtrace=True,
         diagnose=True
     )
@@ -50,6 +57,7 @@ def setup_logging() -> None:
         rotation=settings.log.rotation,
         retention="90 days",
         compression=settings.log.compression,
+        enqueue=True,
         backtrace=True,
         diagnose=True
     )
@@ -62,6 +70,7 @@ def setup_logging() -> None:
         rotation=settings.log.rotation,
         retention=settings.log.retention,
         compression=settings.log.compression,
+        enqueue=True,
         filter=lambda record: "order" in record["extra"].get("category", "")
     )
 
@@ -73,6 +82,7 @@ def setup_logging() -> None:
         rotation=settings.log.rotation,
         retention=settings.log.retention,
         compression=settings.log.compression,
+        enqueue=True,
         filter=lambda record: "email" in record["extra"].get("category", "")
     )
 
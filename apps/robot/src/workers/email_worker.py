@@ -19,7 +19,7 @@ from src.db.sqlserver import db
 from src.robots.mann_hummel import MannHummelRobot
 from src.robots.mutlu_aku import MutluAkuRobot
 from src.robots.base import RobotResult
-from src.notifications.email_sender import EmailSender
+from src.notifications.email_sender import email_sender, send_order_result_email
 
 
 class EmailWorker:
@@ -32,16 +32,22 @@ class EmailWorker:
     - Parse Excel attachments for order data
     - Create order records in database
     - Queue orders for robot processing
+
+    When an order_queue is given, created orders are handed off to the
+    OrderWorker through it; otherwise they are processed inline.
     """
 
-    def __init__(self, db_session=None):
+    def __init__(self, db_session=None, order_queue: Optional[asyncio.Queue] = None):
         self.db_session = db_session
+        self.order_queue = order_queue
         self.fetcher = EmailFetcher()
+        self.idle_fetcher = EmailFetcher()  # dedicated IDLE connection
         self.email_parser = EmailParser()
         self.excel_parser = ExcelParser()
 
         self.is_running = False
         self.poll_interval = settings.email.poll_interval
+        self.use_idle = settings.email.use_idle
         self._stop_event = asyncio.Event()
 
     async def start(self):
@@ -59,6 +65,7 @@ class EmailWorker:
             raise
         finally:
             self.is_running = False
+            await self.idle_fetcher.disconnect()
 
     async def stop(self):
         """Stop the email worker"""
@@ -75,14 +82,32 @@ class EmailWorker:
             except Exception as e:
                 email_logger.error(f"Error in poll cycle: {e}")
 
-            # Wait for next poll or stop signal
+            # Wait for new mail (IDLE push) or next poll / stop signal
+            await self._wait_for_new_mail()
+
+    async def _wait_for_new_mail(self):
+        """Wait for IMAP IDLE notification, falling back to interval polling"""
+        if self.use_idle:
             try:
-                await asyncio.wait_for(
-                    self._stop_event.wait(),
-                    timeout=self.poll_interval
-                )
-            except asyncio.TimeoutError:
-                pass  # Normal timeout, continue polling
+                if not self.idle_fetcher.client:
+                    await self.idle_fetcher.connect()
+                if self.idle_fetcher.supports_idle():
+                    await self.idle_fetcher.idle_wait(self._stop_event)
+                    return
+                email_logger.warning("IMAP server does not support IDLE, polling instead")
+                self.use_idle = False
+                await self.idle_fetcher.disconnect()
+            except Exception as e:
+                email_logger.warning(f"IMAP IDLE failed, polling instead: {e}")
+                await self.idle_fetcher.disconnect()
+
+        try:
+            await asyncio.wait_for(
+                self._stop_event.wait(),
+                timeout=self.poll_interval
+            )
+        except asyncio.TimeoutError:
+            pass  # Normal timeout, continue polling
 
     async def _poll_emails(self):
         """Single poll cycle"""
@@ -237,7 +262,10 @@ class EmailWorker:
             # Auto-process orders with robots
             for order_info in orders_created:
                 try:
-                    await self._auto_process_order(order_info)
+                    if self.order_queue is not None:
+                        await self._enqueue_order(order_info)
+                    else:
+                        await self._auto_process_order(order_info)
                 except Exception as e:
                     email_logger.error(f"Auto-process failed for {order_info['order_code']}: {e}")
         else:
@@ -330,7 +358,6 @@ class EmailWorker:
     def _notify_order_created(self, order_info: Dict[str, Any]):
         """Send notification email when a new order is created"""
         try:
-            sender = EmailSender()
             order_code = order_info['order_code']
             supplier = order_info['supplier_type']
             customer = order_info.get('customer_name', 'Bilinmiyor')
@@ -352,48 +379,26 @@ class EmailWorker:
             )
 
             for recipient in settings.notification.recipients:
-                sender.send_email(recipient, subject, body)
+                email_sender.send_email(recipient, subject, body)
 
             email_logger.info(f"Order notification sent for {order_code}")
         except Exception as e:
             email_logger.error(f"Failed to send order notification: {e}")
 
-    def _notify_order_completed(self, order_info: Dict[str, Any], result: RobotResult):
-        """Send notification email when order processing completes"""
-        try:
-            sender = EmailSender()
-            order_code = order_info['order_code']
-            supplier = order_info['supplier_type']
-            db_id = order_info.get('db_id', '')
-            supplier_name = "Mann & Hummel" if supplier == "MANN" else "Mutlu Akü" if supplier == "MUTLU" else supplier
-            order_url = f"https://kolayrobot.com/dashboard/orders/{db_id}" if db_id else "https://kolayrobot.com/dashboard/orders"
+    async def _enqueue_order(self, order_info: Dict[str, Any]):
+        """
+        Hand order off to the OrderWorker via the shared queue
 
-            if result.success:
-                subject = f"Sipariş Tamamlandı: {order_code} - {supplier_name}"
-                body = (
-                    f"Sipariş başarıyla işlendi:\n\n"
-                    f"Sipariş Kodu: {order_code}\n"
-                    f"Tedarikçi: {supplier_name}\n"
-                    f"Portal Sipariş No: {result.portal_order_no}\n"
-                    f"Süre: {result.duration_seconds:.0f} saniye\n\n"
-                    f"Sipariş Detay: {order_url}\n"
-                )
-            else:
-                subject = f"Sipariş HATA: {order_code} - {supplier_name}"
-                body = (
-                    f"Sipariş işlenirken hata oluştu:\n\n"
-                    f"Sipariş Kodu: {order_code}\n"
-                    f"Tedarikçi: {supplier_name}\n"
-                    f"Hata: {result.message}\n\n"
-                    f"Sipariş Detay: {order_url}\n"
-                )
+        Blocks while the queue is full so back-pressure reaches the IMAP poll.
 
-            for recipient in settings.notification.recipients:
-                sender.send_email(recipient, subject, body)
+        Args:
+            order_info: Order info dict from _create_order_from_data
+        """
+        # Notify: order created and being processed
+        await asyncio.to_thread(self._notify_order_created, order_info)
 
-            email_logger.info(f"Order completion notification sent for {order_code}")
-        except Exception as e:
-            email_logger.error(f"Failed to send completion notification: {e}")
+        await self.order_queue.put(order_info)
+        email_logger.info(f"Order {order_info['order_code']} queued for robot processing")
 
     async def _auto_process_order(self, order_info: Dict[str, Any]):
         """
@@ -409,12 +414,13 @@ class EmailWorker:
         email_logger.info(f"Auto-processing order {order_code} with {supplier_type} robot...")
 
         # Notify: order created and being processed
-        self._notify_order_created(order_info)
+        await asyncio.to_thread(self._notify_order_created, order_info)
 
         try:
-            # Update status to processing
-            if db_id:
-                db.update_order_status(db_id, 'PROCESSING')
+            # Claim PENDING -> PROCESSING; the API may have started this order already
+            if db_id and not db.claim_order(db_id):
+                email_logger.warning(f"Order {order_code} is no longer pending, skipping")
+                return
 
             # Parse items from Excel attachment
             items = order_info.get('items', [])
@@ -481,7 +487,7 @@ class EmailWorker:
                 email_logger.error(f"Order {order_code} failed: {result.message}")
 
             # Notify: order completed or failed
-            self._notify_order_completed(order_info, result)
+            await asyncio.to_thread(send_order_result_email, order_info, result)
 
         except Exception as e:
             email_logger.error(f"Auto-process error for {order_code}: {e}")
@@ -493,7 +499,7 @@ class EmailWorker:
             # Notify: error
             error_result = RobotResult(success=False, order_id=order_code)
             error_result.message = str(e)
-            self._notify_order_completed(order_info, error_result)
+            await asyncio.to_thread(send_order_result_email, order_info, error_result)
 
     async def process_single_email(self, email_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -4,16 +4,25 @@ Background worker for processing orders with supplier robots
 """
 
 import asyncio
+from concurrent.futures import Executor
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 from enum import Enum
 
-from src.config import settings
 from src.utils.logger import logger, order_logger
 from src.robots.mutlu_aku import MutluAkuRobot
 from src.robots.mann_hummel import MannHummelRobot
 from src.robots.base import RobotResult
 from src.db.models import Order, OrderItem, OrderStatus
+from src.db.sqlserver import db
+from src.parser.excel_parser import ExcelParser
+from src.notifications.email_sender import send_order_result_email
+
+# Per-supplier queue bound - keeps back-pressure flowing to the email worker
+SUPPLIER_QUEUE_MAXSIZE = 10
+
+# Error recorded on orders cut off by a shutdown (or found PROCESSING at startup)
+INTERRUPTED_ORDER_MESSAGE = "Robot interrupted by a service restart - check the supplier portal before retrying"
 
 
 class OrderWorker:
@@ -27,21 +36,35 @@ class OrderWorker:
     - Update order status
     - Handle retries and failures
     - Support parallel processing (Mann & Mutlu can run simultaneously)
+
+    Orders arrive through order_queue (shared with the EmailWorker) and are
+    routed to the per-supplier queues. When a process pool is given, each
+    robot runs in its own process instead of on this event loop.
     """
 
-    def __init__(self, db_session=None):
+    def __init__(
+        self,
+        db_session=None,
+        order_queue: Optional[asyncio.Queue] = None,
+        pool: Optional[Executor] = None
+    ):
         self.db_session = db_session
+        self.order_queue = order_queue
+        self.pool = pool
         self.is_running = False
         self._stop_event = asyncio.Event()
 
         # Separate queues for each supplier (parallel processing)
-        self._mutlu_queue: asyncio.Queue = asyncio.Queue()
-        self._mann_queue: asyncio.Queue = asyncio.Queue()
+        self._mutlu_queue: asyncio.Queue = asyncio.Queue(maxsize=SUPPLIER_QUEUE_MAXSIZE)
+        self._mann_queue: asyncio.Queue = asyncio.Queue(maxsize=SUPPLIER_QUEUE_MAXSIZE)
 
         # Active tasks
         self._mutlu_task: Optional[asyncio.Task] = None
         self._mann_task: Optional[asyncio.Task] = None
 
+        # DB ids of queued/in-flight orders - an order is only queued once
+        self._queued_ids: set = set()
+
     async def start(self):
         """Start the order worker"""
         order_logger.info("Starting order worker...")
@@ -57,6 +80,9 @@ class OrderWorker:
                 self._process_supplier_queue("MANN", self._mann_queue)
             )
 
+            # Recover orders left over from a previous run
+            await self._recover_orders()
+
             # Start queue monitor
             await self._monitor_pending_orders()
 
@@ -90,15 +116,49 @@ class OrderWorker:
             except asyncio.CancelledError:
                 pass
 
+    async def _recover_orders(self):
+        """
+        Fail interrupted orders and queue PENDING ones from the database
+
+        A PROCESSING order was cut off mid-run - the portal may already have
+        accepted it, so it is marked FAILED for review instead of re-run.
+        """
+        try:
+            failed = await asyncio.to_thread(db.fail_interrupted_orders, INTERRUPTED_ORDER_MESSAGE)
+            if failed:
+                order_logger.warning(f"Marked {failed} interrupted order(s) FAILED for review")
+            rows = await asyncio.to_thread(db.get_pending_orders)
+        except Exception as e:
+            order_logger.error(f"Failed to recover orders from database: {e}")
+            return
+
+        for row in rows:
+            await self.queue_order(order_info_from_row(row))
+
+        if rows:
+            order_logger.info(f"Queued {len(rows)} pending order(s) from database")
+
     async def _monitor_pending_orders(self):
         """Monitor and queue pending orders"""
         order_logger.info("Order monitor started")
 
         while not self._stop_event.is_set():
             try:
-                # TODO: Fetch pending orders from database
-                # For now, just wait
-                await asyncio.sleep(10)
+                if self.order_queue is None:
+                    # Standalone run - only the orders re-queued at startup
+                    await asyncio.sleep(10)
+                    continue
+
+                # Wait for order from email worker with timeout
+                try:
+                    order_info = await asyncio.wait_for(self.order_queue.get(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    continue
+
+                try:
+                    await self.queue_order(order_info)
+                finally:
+                    self.order_queue.task_done()
 
             except Exception as e:
                 order_logger.error(f"Error monitoring orders: {e}")
@@ -124,8 +184,11 @@ class OrderWorker:
 
                 # Process order
                 order_logger.info(f"[{supplier_code}] Processing order: {order_info.get('order_code')}")
-                await self._process_order(order_info, supplier_code)
-                queue.task_done()
+                try:
+                    await self._process_order(order_info, supplier_code)
+                finally:
+                    self._queued_ids.discard(order_info.get('db_id') or order_info.get('id'))
+                    queue.task_done()
 
             except asyncio.CancelledError:
                 break
@@ -141,24 +204,46 @@ class OrderWorker:
             supplier_code: MUTLU or MANN
         """
         order_code = order_info.get('order_code', 'UNKNOWN')
+        # Orders from the email worker carry the database ID separately
+        order_id = order_info.get('db_id') or order_info.get('id')
         order_logger.info(f"Processing order {order_code} with {supplier_code} robot")
 
+        # Claim PENDING -> PROCESSING; the API may have started this order already.
+        # Orders that never made it into the DB have nothing to claim
+        if not await self._claim_order(order_info.get('db_id')):
+            order_logger.warning(f"Order {order_code} is no longer pending, skipping")
+            return
+
         try:
-            # Update status to PROCESSING
-            await self._update_order_status(order_info['id'], OrderStatus.PROCESSING)
 
-            # Create mock Order object for robot
-            # In production, this would be loaded from database
-            order = self._create_order_object(order_info)
-            order_items = self._create_order_items(order_info.get('items', []))
+            # Parse items from Excel attachment (orders re-queued from the DB carry none)
+            if not order_info.get('items'):
+                order_info['items'] = await asyncio.to_thread(
+                    self._load_items, order_info.get('attachment_path')
+                )
+
+            if not order_info['items']:
+                raise Exception("No order items found")
+
+            if self.pool is not None:
+                # Run robot in a separate process (order_info must be pickle-safe)
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(
+                    self.pool, run_robot_in_process, supplier_code, order_info
+                )
+            else:
+                # Create mock Order object for robot
+                # In production, this would be loaded from database
+                order = self._create_order_object(order_info)
+                order_items = self._create_order_items(order_info.get('items', []))
 
-            # Select and run robot
-            result = await self._run_robot(supplier_code, order, order_items)
+                # Select and run robot
+                result = await self._run_robot(supplier_code, order, order_items)
 
             # Update order based on result
             if result.success:
                 await self._update_order_status(
-                    order_info['id'],
+                    order_id,
                     OrderStatus.COMPLETED,
                     portal_order_no=result.portal_order_no
                 )
@@ -167,19 +252,42 @@ class OrderWorker:
                 )
             else:
                 await self._update_order_status(
-                    order_info['id'],
+                    order_id,
                     OrderStatus.FAILED,
                     error_message=result.message
                 )
                 order_logger.error(f"Order {order_code} failed: {result.message}")
 
+        except asyncio.CancelledError:
+            # Shutdown mid-run - the portal may already have the order, flag it for review
+            order_logger.warning(f"Order {order_code} interrupted by shutdown")
+            await self._update_order_status(
+                order_id,
+                OrderStatus.FAILED,
+                error_message=INTERRUPTED_ORDER_MESSAGE
+            )
+            raise
         except Exception as e:
             order_logger.error(f"Error processing order {order_code}: {e}")
             await self._update_order_status(
-                order_info['id'],
+                order_id,
                 OrderStatus.FAILED,
                 error_message=str(e)
             )
+            result = RobotResult(success=False, order_id=order_code)
+            result.message = str(e)
+
+        # Notify: order completed or failed
+        await asyncio.to_thread(send_order_result_email, order_info, result)
+
+    def _load_items(self, attachment_path: Optional[str]) -> List[Dict[str, Any]]:
+        """Parse order items from the Excel attachment"""
+        if not attachment_path:
+            return []
+        parsed = ExcelParser().parse_file(attachment_path)
+        if parsed and parsed.items:
+            return [item.to_dict() for item in parsed.items]
+        return []
 
     async def _run_robot(
         self,
@@ -210,9 +318,9 @@ class OrderWorker:
     def _create_order_object(self, order_info: Dict[str, Any]) -> Order:
         """Create Order object from dict"""
         order = Order(
-            id=order_info.get('id', ''),
+            id=order_info.get('db_id') or order_info.get('id', ''),
             order_code=order_info.get('order_code', ''),
-            caspar_order_no=order_info.get('caspar_order_no'),
+            caspar_order_no=order_info.get('caspar_order_no') or order_info.get('order_code', ''),
             status=OrderStatus.PENDING,
             supplier_id='',  # Would be set from DB
             customer_id='',  # Would be set from DB
@@ -237,6 +345,17 @@ class OrderWorker:
             items.append(item)
         return items
 
+    async def _claim_order(self, order_id: Optional[str]) -> bool:
+        """Atomically move a PENDING order to PROCESSING"""
+        if not order_id:
+            return True
+
+        try:
+            return await asyncio.to_thread(db.claim_order, order_id)
+        except Exception as e:
+            order_logger.error(f"Failed to claim order {order_id}: {e}")
+            return False
+
     async def _update_order_status(
         self,
         order_id: str,
@@ -253,8 +372,20 @@ class OrderWorker:
             portal_order_no: Portal order number (on success)
             error_message: Error message (on failure)
         """
-        # TODO: Implement database update
         order_logger.debug(f"Status update: {order_id} -> {status.value}")
+        if not order_id:
+            return
+
+        try:
+            await asyncio.to_thread(
+                db.update_order_status,
+                order_id,
+                status.value,
+                error_message=error_message,
+                portal_order_number=portal_order_no
+            )
+        except Exception as e:
+            order_logger.error(f"Failed to update order status {order_id}: {e}")
 
     async def queue_order(self, order_info: Dict[str, Any]):
         """
@@ -264,6 +395,14 @@ class OrderWorker:
             order_info: Order data dict with supplier_type
         """
         supplier_type = order_info.get('supplier_type', '')
+        order_id = order_info.get('db_id') or order_info.get('id')
+
+        if order_id and order_id in self._queued_ids:
+            order_logger.debug(f"Order already queued: {order_info.get('order_code')}")
+            return
+
+        if supplier_type in ("MUTLU", "MANN") and order_id:
+            self._queued_ids.add(order_id)
 
         if supplier_type == "MUTLU":
             await self._mutlu_queue.put(order_info)
@@ -301,3 +440,43 @@ class OrderWorker:
             "mutlu_queue": self._mutlu_queue.qsize(),
             "mann_queue": self._mann_queue.qsize(),
         }
+
+
+def run_robot_in_process(supplier_code: str, order_info: Dict[str, Any]) -> RobotResult:
+    """
+    Process pool entry point - run one robot on a fresh event loop
+
+    Args:
+        supplier_code: MUTLU or MANN
+        order_info: Order data dict (pickle-safe)
+
+    Returns:
+        RobotResult without the live RobotError (not picklable)
+    """
+    worker = OrderWorker()
+    order = worker._create_order_object(order_info)
+    order_items = worker._create_order_items(order_info.get('items', []))
+
+    result = asyncio.run(worker._run_robot(supplier_code, order, order_items))
+    result.error = None
+    return result
+
+
+def order_info_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build a queueable order info dict from an orders table row
+
+    Items aren't stored in the DB - _process_order re-parses attachment_path.
+    """
+    order_id = str(row['id'])
+    return {
+        'id': order_id,
+        'db_id': order_id,
+        'order_code': row.get('order_code'),
+        'supplier_type': row.get('supplier_type'),
+        'customer_code': row.get('customer_code') or '',
+        'customer_name': row.get('customer_name') or '',
+        'attachment_filename': row.get('attachment_filename'),
+        'attachment_path': row.get('attachment_path'),
+        'items': [],
+    }
@@ -4,8 +4,10 @@ APScheduler-based job scheduling for background tasks
 """
 
 import asyncio
+import re
 from datetime import datetime, timedelta
 from typing import Optional, Callable, List
+import httpx
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
@@ -13,6 +15,9 @@ from apscheduler.triggers.interval import IntervalTrigger
 from src.config import settings
 from src.utils.logger import logger
 
+# Screenshot directories are named YYYY-MM-DD, so they order as strings
+_DATE_DIR_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
 
 class Scheduler:
     """
@@ -23,10 +28,14 @@ class Scheduler:
     - Log cleanup
     - Daily reports
     - Screenshot cleanup
+
+    http_client is the process-wide keep-alive client (owned and closed by
+    main()) for jobs that make outbound HTTP calls.
     """
 
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         self.scheduler = AsyncIOScheduler()
+        self.http_client = http_client
         self._jobs: List[str] = []
 
     def start(self):
@@ -231,22 +240,20 @@ class Scheduler:
         if not screenshot_dir.exists():
             return
 
-        cutoff = datetime.now() - timedelta(days=7)  # Keep 7 days
+        # Keep 7 days - ISO dates compare lexicographically, no parsing needed
+        cutoff = (datetime.now() - timedelta(days=7)).date().isoformat()
         deleted_count = 0
 
         for date_dir in screenshot_dir.iterdir():
+            name = date_dir.name
+            if name > cutoff or not _DATE_DIR_RE.fullmatch(name):
+                continue  # Recent, or not a date directory
             if not date_dir.is_dir():
                 continue
 
-            try:
-                # Parse date from directory name
-                dir_date = datetime.strptime(date_dir.name, "%Y-%m-%d")
-                if dir_date < cutoff:
-                    shutil.rmtree(date_dir)
-                    deleted_count += 1
-                    logger.debug(f"Deleted screenshot directory: {date_dir}")
-            except ValueError:
-                continue  # Not a date directory
+            shutil.rmtree(date_dir)
+            deleted_count += 1
+            logger.debug(f"Deleted screenshot directory: {date_dir}")
 
         logger.info(f"Screenshot cleanup complete. Deleted {deleted_count} directories.")
 